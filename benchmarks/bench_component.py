@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+CoEModelPicker 요청당 오버헤드 벤치마크 (pytest-benchmark).
+
+프로세스 내 stub 백엔드(conftest.py)를 상대로 모델 목록 조회, tools 직렬화,
+도구 루프 전체(_call_chat), Message 출력 변환을 측정합니다.
+
+사용법 (Langflow가 설치된 환경에서 저장소 루트 기준):
+    pip install pytest pytest-benchmark
+    pytest benchmarks/ --benchmark-only
+    pytest benchmarks/ --benchmark-only --benchmark-save=baseline      # 기준 저장
+    pytest benchmarks/ --benchmark-only --benchmark-compare=0001        # 회귀 비교
+"""
+from __future__ import annotations
+
+from typing import Any, Dict
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+MODEL_NAME = "Model 0"
+
+CALL_CHAT_SCENARIOS: Dict[str, Dict[str, Any]] = {
+    "no_tools": {"tool_rounds": 0},
+    "tools_3x2": {"tool_rounds": 3, "calls_per_round": 2},
+    "tools_3x2_64kb": {"tool_rounds": 3, "calls_per_round": 2, "payload_kb": 64},
+    "tools_2x4_latency_10ms": {"tool_rounds": 2, "calls_per_round": 4, "latency_s": 0.01},
+}
+
+
+@pytest.mark.parametrize("models", [20, 500])
+def bench_fetch_models(benchmark, stub, make_component, models):
+    base = stub(models=models)
+    component = make_component(backend_url=base)
+    pairs = benchmark(component._fetch_models, base)
+    assert pairs
+
+
+@pytest.mark.parametrize("tool_count", [5, 50])
+def bench_build_tools_payload_cold(benchmark, coe, make_component, make_tools, tool_count):
+    component = make_component(tools=make_tools(tool_count))
+
+    def _reset():
+        coe._TOOL_SCHEMA_CACHE.clear()
+        component._tools_payload_cache = None
+
+    tools_payload, _ = benchmark.pedantic(component._build_tools_payload, setup=_reset, rounds=200)
+    assert len(tools_payload) >= tool_count
+
+
+@pytest.mark.parametrize("tool_count", [5, 50])
+def bench_build_tools_payload_warm(benchmark, make_component, make_tools, tool_count):
+    component = make_component(tools=make_tools(tool_count))
+    component._build_tools_payload()
+    tools_payload, _ = benchmark(component._build_tools_payload)
+    assert len(tools_payload) >= tool_count
+
+
+@pytest.mark.parametrize("scenario", list(CALL_CHAT_SCENARIOS))
+def bench_call_chat_tool_loop(benchmark, stub, make_component, make_tools, run_async, scenario):
+    script = CALL_CHAT_SCENARIOS[scenario]
+    base = stub(**script)
+    component = make_component(
+        backend_url=base,
+        model_name=MODEL_NAME,
+        tools=make_tools(4, output_kb=script.get("payload_kb", 1)),
+        response_cache_ttl=0,
+    )
+
+    def _run():
+        return run_async(component._call_chat("질문", "system prompt", MODEL_NAME, base, False, True, True))
+
+    payload = benchmark(_run)
+    assert len(payload["message"]["data"].get("tool_results") or []) == (
+        script.get("tool_rounds", 0) * script.get("calls_per_round", 1)
+    )
+
+
+@pytest.mark.parametrize("profile", ["full", "lean", "lazy"])
+def bench_prepare_message_output(benchmark, stub, make_component, make_tools, run_async, profile):
+    base = stub(tool_rounds=4, calls_per_round=2, payload_kb=16)
+    component = make_component(
+        backend_url=base,
+        model_name=MODEL_NAME,
+        tools=make_tools(4, output_kb=16),
+        output_profile=profile,
+    )
+    payload = run_async(component._call_chat("질문", "system prompt", MODEL_NAME, base, False, True, True))
+    result = benchmark(component._prepare_message_output, payload)
+    assert result is not None
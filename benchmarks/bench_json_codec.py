@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+JSON 코덱 마이크로벤치마크: 기존 경로(json.dumps → encode / decode → json.loads)와
+langflow_coe_component의 bytes 입출력 코덱(stdlib/orjson/msgspec)을 비교합니다.
+
+페이로드는 도구 루프 후반 /v1/chat/completions 요청과 비슷하게 구성합니다
+(system + user + N회의 tool_calls/tool 응답, tools 스키마 목록).
+
+사용법 (Langflow가 설치된 환경에서 저장소 루트 기준):
+    python benchmarks/bench_json_codec.py --tool-turns 8 --tool-output-kb 32 --repeat 200
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import timeit
+from typing import Any, Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import langflow_coe_component as coe  # noqa: E402
+
+
+def _tool_schema(i: int) -> Dict[str, Any]:
+    return {
+        "type": "function",
+        "function": {
+            "name": f"tool_{i}",
+            "description": f"Sample tool {i} used for benchmarking (샘플 도구 {i})",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {"type": "string", "description": "검색어"},
+                    "top_k": {"type": "integer", "default": 5},
+                    "filters": {"type": "object", "additionalProperties": {"type": "string"}},
+                },
+                "required": ["query"],
+            },
+        },
+    }
+
+
+def _tool_output(size_kb: int, rng: random.Random) -> str:
+    docs: List[Dict[str, Any]] = []
+    while len(json.dumps(docs, ensure_ascii=False)) < size_kb * 1024:
+        docs.append(
+            {
+                "id": "".join(rng.choices(string.ascii_lowercase, k=12)),
+                "score": rng.random(),
+                "content": "코드 분석 결과 " + "".join(rng.choices(string.ascii_letters + " ", k=200)),
+                "metadata": {"path": f"src/module_{rng.randint(0, 999)}.py", "line": rng.randint(1, 5000)},
+            }
+        )
+    return json.dumps({"documents": docs}, ensure_ascii=False)
+
+
+def build_payload(tool_turns: int, tool_output_kb: int, tools: int, seed: int = 7) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    messages: List[Dict[str, Any]] = [
+        {"role": "system", "content": "당신은 CoE 플랫폼의 코드 분석 에이전트입니다. " * 20},
+        {"role": "user", "content": "이 저장소의 인증 흐름을 설명하고 관련 파일을 찾아주세요."},
+    ]
+    for turn in range(tool_turns):
+        call_id = f"call_{turn}"
+        messages.append(
+            {
+                "role": "assistant",
+                "content": "",
+                "tool_calls": [
+                    {
+                        "id": call_id,
+                        "type": "function",
+                        "function": {"name": f"tool_{turn % tools}", "arguments": json.dumps({"query": "auth"})},
+                    }
+                ],
+            }
+        )
+        messages.append(
+            {"role": "tool", "tool_call_id": call_id, "name": f"tool_{turn % tools}", "content": _tool_output(tool_output_kb, rng)}
+        )
+    return {
+        "model": "gpt-4o-mini",
+        "messages": messages,
+        "tools": [_tool_schema(i) for i in range(tools)],
+        "tool_choice": "auto",
+    }
+
+
+def _legacy_dumps(obj: Any) -> bytes:
+    return json.dumps(obj).encode("utf-8")
+
+
+def _legacy_loads(data: bytes) -> Any:
+    return json.loads(data.decode("utf-8"))
+
+
+def _bench(fn: Callable[[], Any], repeat: int) -> float:
+    """반복 측정 중 최솟값(ms/op)."""
+    timer = timeit.Timer(fn)
+    return min(timer.repeat(repeat=5, number=max(1, repeat // 5))) / max(1, repeat // 5) * 1000
+
+
+def run(tool_turns: int, tool_output_kb: int, tools: int, repeat: int) -> List[Tuple[str, float, float, int]]:
+    payload = build_payload(tool_turns, tool_output_kb, tools)
+    response_body = _legacy_dumps({"choices": [{"index": 0, "message": payload["messages"][-1]}], "echo": payload})
+
+    rows: List[Tuple[str, float, float, int]] = []
+    encoded = _legacy_dumps(payload)
+    rows.append(
+        (
+            "legacy (json + str copy)",
+            _bench(lambda: _legacy_dumps(payload), repeat),
+            _bench(lambda: _legacy_loads(response_body), repeat),
+            len(encoded),
+        )
+    )
+    for name, codec in coe._JSON_CODECS.items():
+        encoded = codec.dumps(payload)
+        rows.append(
+            (
+                name,
+                _bench(lambda codec=codec: codec.dumps(payload), repeat),
+                _bench(lambda codec=codec: codec.loads(response_body), repeat),
+                len(encoded),
+            )
+        )
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tool-turns", type=int, default=8)
+    parser.add_argument("--tool-output-kb", type=int, default=32)
+    parser.add_argument("--tools", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args()
+
+    rows = run(args.tool_turns, args.tool_output_kb, args.tools, args.repeat)
+    print(f"selected codec: {coe.JSON_CODEC.name}")
+    print(f"{'codec':<26}{'encode ms':>12}{'decode ms':>12}{'bytes':>12}")
+    for name, enc_ms, dec_ms, size in rows:
+        print(f"{name:<26}{enc_ms:>12.3f}{dec_ms:>12.3f}{size:>12}")
+
+
+if __name__ == "__main__":
+    main()
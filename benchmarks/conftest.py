@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+벤치마크 공용 fixture: 프로세스 내 OpenAI 호환 stub 백엔드와 컴포넌트 생성 헬퍼.
+
+stub 동작은 StubScript로 조정합니다.
+  - models: /v1/models 카탈로그 크기
+  - tool_rounds / calls_per_round: 최종 답변 전까지 tool_calls를 돌려줄 턴 수와 턴당 호출 수
+  - latency_s: 요청마다 주입할 지연
+  - payload_kb: 최종 답변과 tool_calls 인자에 채울 크기
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# 스크립트형 벤치마크(직접 실행용)는 수집하지 않음
+collect_ignore = ["bench_json_codec.py", "trace_replay.py"]
+
+
+@dataclass
+class StubScript:
+    models: int = 20
+    tool_rounds: int = 0
+    calls_per_round: int = 1
+    latency_s: float = 0.0
+    payload_kb: int = 1
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 헤더/본문이 따로 쓰일 때 Nagle + delayed ACK로 요청마다 ~40ms가 더해지는 것을 방지
+    disable_nagle_algorithm = True
+    script = StubScript()
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+    def _send(self, obj: Dict[str, Any]) -> None:
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        owners = ("openai", "sktax", "other")
+        data = [
+            {"id": f"model-{i}", "name": f"Model {i}", "owned_by": owners[i % len(owners)]}
+            for i in range(self.script.models)
+        ]
+        self._send({"object": "list", "data": data})
+
+    def do_POST(self) -> None:
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+        script = self.script
+        if script.latency_s:
+            time.sleep(script.latency_s)
+        messages = request.get("messages") or []
+        last_user = max((i for i, m in enumerate(messages) if m.get("role") == "user"), default=-1)
+        turn = sum(1 for m in messages[last_user + 1 :] if m.get("role") == "assistant")
+        tool_names = [t["function"]["name"] for t in request.get("tools") or []]
+        filler = "x" * (script.payload_kb * 1024)
+        if tool_names and turn < script.tool_rounds:
+            calls = [
+                {
+                    "id": f"call_{turn}_{i}",
+                    "type": "function",
+                    "function": {
+                        "name": tool_names[i % len(tool_names)],
+                        "arguments": json.dumps({"query": f"q{turn}-{i}", "context": filler}),
+                    },
+                }
+                for i in range(script.calls_per_round)
+            ]
+            message: Dict[str, Any] = {"role": "assistant", "content": None, "tool_calls": calls}
+            finish_reason = "tool_calls"
+        else:
+            message = {"role": "assistant", "content": f"answer after {turn} tool rounds: {filler}"}
+            finish_reason = "stop"
+        self._send(
+            {
+                "id": f"stub-{turn}",
+                "object": "chat.completion",
+                "model": request.get("model"),
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                "usage": {"prompt_tokens": len(messages) * 10, "completion_tokens": 10},
+            }
+        )
+
+
+class BenchTool:
+    """고정 크기 출력을 돌려주는 async 도구 (args_schema는 JSON Schema dict)."""
+
+    def __init__(self, index: int, output_kb: int = 1) -> None:
+        self.name = f"tool_{index}"
+        self.description = f"Benchmark tool {index}"
+        self.args_schema = {
+            "type": "object",
+            "properties": {
+                "query": {"type": "string", "description": "검색어"},
+                "context": {"type": "string"},
+                "top_k": {"type": "integer", "default": 5},
+            },
+            "required": ["query"],
+        }
+        self._output = {"documents": ["y" * 256 for _ in range(max(1, output_kb * 4))]}
+
+    async def ainvoke(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        return self._output
+
+
+@pytest.fixture(scope="session")
+def coe() -> Any:
+    pytest.importorskip("langflow")
+    import langflow_coe_component
+
+    return langflow_coe_component
+
+
+@pytest.fixture(scope="session")
+def stub_server() -> Iterator[str]:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def stub(stub_server: str) -> Iterator[Callable[..., str]]:
+    """stub(**StubScript 필드) → base URL. 테스트 종료 시 기본 스크립트로 되돌립니다."""
+
+    def _configure(**script: Any) -> str:
+        _StubHandler.script = StubScript(**script)
+        return stub_server
+
+    yield _configure
+    _StubHandler.script = StubScript()
+
+
+@pytest.fixture
+def make_component(coe: Any) -> Callable[..., Any]:
+    def _make(**inputs: Any) -> Any:
+        component = coe.CoEModelPicker()
+        setter = getattr(component, "set", None)
+        if callable(setter):
+            setter(**inputs)
+        else:
+            for key, value in inputs.items():
+                setattr(component, key, value)
+        return component
+
+    return _make
+
+
+@pytest.fixture
+def make_tools() -> Callable[..., List[BenchTool]]:
+    def _make(count: int, output_kb: int = 1) -> List[BenchTool]:
+        return [BenchTool(i, output_kb) for i in range(count)]
+
+    return _make
+
+
+@pytest.fixture
+def run_async() -> Iterator[Callable[[Any], Any]]:
+    """한 이벤트 루프를 재사용해 코루틴을 실행 (루프별 커넥션 풀이 매 라운드 새로 만들어지지 않도록)."""
+    loop = asyncio.new_event_loop()
+    try:
+        yield loop.run_until_complete
+    finally:
+        loop.close()
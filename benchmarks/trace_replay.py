@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+CoEModelPicker 교환 기록(trace) 재생 부하 생성기.
+
+1) 기록: 실제 환경에서 COE_TRACE_RECORD 환경 변수를 지정하면 _call_chat 1회마다
+   턴별 모델 응답/dispatch 지연과 도구 호출 인자/출력/실행 시간이 JSON 1줄로 추가됩니다(.gz면 gzip).
+       COE_TRACE_RECORD=/tmp/coe-trace.jsonl.gz langflow run ...
+
+2) 재생: 기록된 응답을 돌려주는 로컬 stub 백엔드(별도 프로세스)와 기록된 출력을 돌려주는
+   재생용 도구를 띄우고, 지정한 동시성/시간 배율로 CoEModelPicker를 반복 호출합니다.
+   stub은 별도 프로세스라 CPU 시간은 컴포넌트(이벤트 루프, HTTP 클라이언트, 직렬화) 몫만 집계됩니다.
+
+사용법 (Langflow가 설치된 환경에서 저장소 루트 기준):
+    python benchmarks/trace_replay.py /tmp/coe-trace.jsonl.gz --calls 200 --concurrency 16 --time-scale 0.5
+    python benchmarks/trace_replay.py /tmp/coe-trace.jsonl.gz --calls 50 --allocations
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gzip
+import json
+import math
+import multiprocessing
+import os
+import re
+import sys
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# 동일 입력이 single-flight로 합쳐지지 않도록 호출마다 붙이는 꼬리표 (stub이 제거 후 매칭)
+REPLAY_TAG = re.compile(r"\n\n\[replay #-?\d+\]$")
+
+
+def load_trace(path: str) -> List[Dict[str, Any]]:
+    opener = gzip.open if path.endswith(".gz") else open
+    entries: List[Dict[str, Any]] = []
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entries.append(json.loads(line))
+    if not entries:
+        raise SystemExit(f"no trace entries in {path}")
+    return entries
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# stub 백엔드 (별도 프로세스)
+def _serve_stub(entries: List[Dict[str, Any]], time_scale: float, port_queue: Any) -> None:
+    by_input: Dict[str, Dict[str, Any]] = {}
+    for entry in entries:
+        by_input.setdefault(entry.get("input") or "", entry)
+    models: Dict[str, Dict[str, Any]] = {}
+    for entry in entries:
+        model_id = entry.get("model_id") or entry.get("model_name") or "replay-model"
+        models[model_id] = {"id": model_id, "name": entry.get("model_name") or model_id, "owned_by": "openai"}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # 헤더/본문이 따로 쓰일 때 Nagle + delayed ACK로 요청마다 ~40ms가 더해지는 것을 방지
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+        def _send(self, code: int, obj: Dict[str, Any]) -> None:
+            body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self) -> None:
+            self._send(200, {"object": "list", "data": list(models.values())})
+
+        def do_POST(self) -> None:
+            raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if self.headers.get("Content-Encoding") == "gzip":
+                raw = gzip.decompress(raw)
+            request = json.loads(raw)
+            messages = request.get("messages") or []
+            last_user = max((i for i, m in enumerate(messages) if m.get("role") == "user"), default=-1)
+            user_text = REPLAY_TAG.sub("", str(messages[last_user].get("content") or "")) if last_user >= 0 else ""
+            turn = sum(1 for m in messages[last_user + 1 :] if m.get("role") == "assistant")
+            entry = by_input.get(user_text)
+            if entry is None or turn >= len(entry["turns"]):
+                self._send(404, {"error": {"message": "no recorded exchange for this request"}})
+                return
+            recorded = entry["turns"][turn]
+            time.sleep(max(0.0, float(recorded.get("ms") or 0)) / 1000 * time_scale)
+            message = recorded["message"]
+            self._send(
+                200,
+                {
+                    "id": f"replay-{turn}",
+                    "object": "chat.completion",
+                    "model": request.get("model"),
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": message,
+                            "finish_reason": "tool_calls" if message.get("tool_calls") else "stop",
+                        }
+                    ],
+                },
+            )
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 재생용 도구
+class ReplayTool:
+    """기록된 (이름, 인자) → 출력을 기록된 실행 시간 × time_scale 뒤에 돌려주는 async 도구."""
+
+    def __init__(self, schema: Dict[str, Any], outputs: Dict[str, Tuple[str, float]], time_scale: float) -> None:
+        function = schema.get("function") or {}
+        self.name = function.get("name") or ""
+        self.description = function.get("description") or ""
+        self.args_schema = function.get("parameters") or {"type": "object", "properties": {}}
+        self._outputs = outputs
+        self._time_scale = time_scale
+
+    async def ainvoke(self, arguments: Dict[str, Any]) -> str:
+        key = json.dumps(arguments, sort_keys=True, ensure_ascii=False)
+        output, ms = self._outputs.get(key) or next(iter(self._outputs.values()), ("", 0.0))
+        await asyncio.sleep(max(0.0, ms) / 1000 * self._time_scale)
+        return output
+
+
+def build_tools(entry: Dict[str, Any], time_scale: float) -> List[ReplayTool]:
+    outputs: Dict[str, Dict[str, Tuple[str, float]]] = {}
+    for turn in entry.get("turns") or []:
+        for call in turn.get("tool_calls") or []:
+            try:
+                arguments = json.loads(call.get("arguments") or "{}")
+            except (TypeError, ValueError):
+                arguments = {}
+            key = json.dumps(arguments, sort_keys=True, ensure_ascii=False)
+            outputs.setdefault(call.get("name") or "", {})[key] = (
+                str(call.get("output") or ""),
+                float(call.get("ms") or 0),
+            )
+    return [
+        ReplayTool(schema, outputs.get((schema.get("function") or {}).get("name") or "", {}), time_scale)
+        for schema in entry.get("tools") or []
+    ]
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 재생
+def _percentile(values: List[float], q: float) -> float:
+    """nearest-rank 백분위수."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), math.ceil(q / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def _make_component(coe: Any, inputs: Dict[str, Any]) -> Any:
+    component = coe.CoEModelPicker()
+    setter = getattr(component, "set", None)
+    if callable(setter):
+        setter(**inputs)
+    else:
+        for key, value in inputs.items():
+            setattr(component, key, value)
+    return component
+
+
+async def replay(
+    entries: List[Dict[str, Any]],
+    backend_url: str,
+    calls: int,
+    concurrency: int,
+    time_scale: float,
+    warmup: int,
+    allocations: bool = False,
+) -> Dict[str, Any]:
+    import langflow_coe_component as coe
+
+    tools_by_entry = [build_tools(entry, time_scale) for entry in entries]
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    latencies: List[float] = []
+    errors: List[str] = []
+
+    async def _one(index: int, record: bool) -> None:
+        entry = entries[index % len(entries)]
+        inputs = {
+            "backend_url": backend_url,
+            "model_name": entry.get("model_name") or entry.get("model_id") or "",
+            "prompt": entry.get("prompt") or "",
+            "chat_input": f"{entry.get('input') or ''}\n\n[replay #{index}]",
+            "tools": tools_by_entry[index % len(entries)],
+            "enable_tools": bool(entry.get("tools")),
+            "response_cache_ttl": 0,
+            "stream": False,
+        }
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await _make_component(coe, inputs).run_message()
+            except Exception as e:  # 재생 실패도 집계
+                errors.append(f"{type(e).__name__}: {e}")
+                return
+            if record:
+                latencies.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(_one(-1 - i, False) for i in range(warmup)))
+    errors.clear()
+
+    # 할당량은 워밍업(모듈/커넥션/카탈로그 준비) 이후 측정 구간만 스냅샷 차이로 집계
+    before: Optional[tracemalloc.Snapshot] = None
+    if allocations:
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        baseline, _ = tracemalloc.get_traced_memory()
+
+    cpu_started = time.process_time()
+    wall_started = time.perf_counter()
+    await asyncio.gather(*(_one(i, True) for i in range(calls)))
+    wall_s = time.perf_counter() - wall_started
+    cpu_s = time.process_time() - cpu_started
+
+    alloc: Dict[str, Any] = {}
+    if before is not None:
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        ignore = (tracemalloc.Filter(False, tracemalloc.__file__),)
+        diff = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), "filename")
+        allocated = sum(stat.size_diff for stat in diff if stat.size_diff > 0)
+        blocks = sum(stat.count_diff for stat in diff if stat.count_diff > 0)
+        alloc = {
+            "alloc_kb_per_call": round(allocated / 1024 / max(1, calls), 2),
+            "alloc_blocks_per_call": round(blocks / max(1, calls), 1),
+            "alloc_peak_kb": round((peak - baseline) / 1024, 1),
+        }
+
+    return {
+        "calls": calls,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "wall_s": round(wall_s, 3),
+        "throughput_rps": round(len(latencies) / wall_s, 2) if wall_s else 0.0,
+        "p50_ms": round(_percentile(latencies, 50), 2),
+        "p95_ms": round(_percentile(latencies, 95), 2),
+        "p99_ms": round(_percentile(latencies, 99), 2),
+        "cpu_ms_per_call": round(cpu_s * 1000 / max(1, calls), 3),
+        **alloc,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace", help="COE_TRACE_RECORD로 기록한 JSONL(.gz) 파일")
+    parser.add_argument("--calls", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--time-scale", type=float, default=1.0, help="기록된 모델/도구 지연에 곱할 배율 (0 = 지연 없음)")
+    parser.add_argument("--warmup", type=int, default=2, help="집계에서 제외할 워밍업 호출 수 (모델 목록/커넥션 준비)")
+    parser.add_argument("--allocations", action="store_true", help="tracemalloc으로 할당량 측정 (지연 수치가 커짐)")
+    parser.add_argument("--json", action="store_true", help="결과를 JSON으로 출력")
+    args = parser.parse_args()
+
+    entries = load_trace(args.trace)
+    port_queue: Any = multiprocessing.Queue()
+    stub = multiprocessing.Process(target=_serve_stub, args=(entries, args.time_scale, port_queue), daemon=True)
+    stub.start()
+    backend_url: Optional[str] = None
+    try:
+        backend_url = f"http://127.0.0.1:{port_queue.get(timeout=10)}"
+        result = asyncio.run(
+            replay(
+                entries, backend_url, args.calls, args.concurrency, args.time_scale, args.warmup, args.allocations
+            )
+        )
+    finally:
+        stub.terminate()
+        stub.join(timeout=5)
+
+    result.update(
+        trace_entries=len(entries),
+        concurrency=args.concurrency,
+        time_scale=args.time_scale,
+    )
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+    for key, value in result.items():
+        print(f"{key:<28}{value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,49 +3,2245 @@
 from __future__ import annotations
 
 import asyncio
+import gzip
+import hashlib
 import inspect
 import json
 import os
+import pickle
+import random
 import socket
+import sqlite3
+import threading
+import time
 import uuid
-from typing import Any, Dict, List, Tuple, Optional
+import weakref
+from collections import OrderedDict, deque
+from email.utils import parsedate_to_datetime
+from contextlib import contextmanager
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Tuple, Optional
 
-# stdlib HTTP
+# 계측 내보내기 (설치되어 있을 때만 사용)
+try:
+    from prometheus_client import REGISTRY as _PROM_REGISTRY, Histogram as _PromHistogram
+except Exception:  # pragma: no cover
+    _PROM_REGISTRY = None  # type: ignore
+    _PromHistogram = None  # type: ignore
+
+try:
+    from opentelemetry import trace as _otel_trace
+except Exception:  # pragma: no cover
+    _otel_trace = None  # type: ignore
+
+# 빠른 JSON 코덱 (설치되어 있을 때만 사용, 없으면 stdlib json)
+try:
+    import orjson
+except Exception:  # pragma: no cover
+    orjson = None  # type: ignore
+
+try:
+    import msgspec
+except Exception:  # pragma: no cover
+    msgspec = None  # type: ignore
+
+# stdlib HTTP (httpx 미설치 환경 폴백)
 import urllib.request as urlreq
-from urllib.error import URLError
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit
+
+# 풀링/keep-alive 비동기 HTTP 클라이언트 (Langflow 런타임 기본 의존성)
+try:
+    import httpx
+except Exception:  # pragma: no cover
+    httpx = None  # type: ignore
+
+# 요청 본문 zstd 압축 (설치되어 있을 때만 사용, 없으면 gzip)
+try:
+    import zstandard
+except Exception:  # pragma: no cover
+    zstandard = None  # type: ignore
+
+# 세션 메모리 Redis 계층 (설치되어 있을 때만 사용)
+try:
+    import redis as _redis
+except Exception:  # pragma: no cover
+    _redis = None  # type: ignore
+
+# HTTP/2는 h2 패키지가 있을 때만 활성화 가능
+try:
+    import h2  # noqa: F401
+    _HAS_H2 = True
+except Exception:  # pragma: no cover
+    _HAS_H2 = False
+
+from langflow.custom.custom_component.component import Component, _get_component_toolkit
+from langflow.inputs.inputs import (
+    BoolInput,
+    FloatInput,
+    HandleInput,
+    IntInput,
+    MessageInput,
+    MultilineInput,
+    StrInput,
+)
+from langflow.io import DropdownInput, Output
+
+# ✅ tools 입력 활성화를 위해 추가
+from langflow.base.agents.agent import LCToolsAgentComponent
+from langflow.field_typing import Tool  # noqa: F401  (입력 타입 선언용)
+
+# Langflow Message (버전 호환)
+try:
+    from langflow.schema.message import Message  # Langflow >= 1.0
+except Exception:  # pragma: no cover
+    try:
+        from langflow.schema import Message  # 일부 구버전
+    except Exception:  # pragma: no cover
+        Message = None  # type: ignore
+
+# Langflow Data (배치 결과 출력용, 버전 호환)
+try:
+    from langflow.schema import Data
+except Exception:  # pragma: no cover
+    Data = None  # type: ignore
+
+ALLOWED_OWNERS = {"openai", "sktax"}
+DEFAULT_BACKEND = os.getenv("COE_BACKEND_URL", "http://host.docker.internal:8000").strip().rstrip("/")
+
+
+def _env_flag(name: str, default: bool = False) -> bool:
+    raw = os.getenv(name)
+    if raw is None:
+        return default
+    return raw.strip().lower() in {"1", "true", "yes", "on"}
+
+
+class _JsonCodec:
+    """bytes 입출력 JSON 코덱. dumps는 UTF-8 bytes(ensure_ascii=False 상당)를 돌려줍니다."""
+
+    def __init__(self, name: str, dumps: Callable[[Any], bytes], loads: Callable[[Any], Any]) -> None:
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+
+
+def _stdlib_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def _stdlib_loads(data: Any) -> Any:
+    # json.loads는 bytes(UTF-8)를 직접 받으므로 decode 사본을 만들지 않음
+    return json.loads(data)
+
+
+_JSON_CODECS: Dict[str, _JsonCodec] = {"stdlib": _JsonCodec("stdlib", _stdlib_dumps, _stdlib_loads)}
+if orjson is not None:
+    _JSON_CODECS["orjson"] = _JsonCodec(
+        "orjson",
+        lambda obj: orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS),
+        orjson.loads,
+    )
+if msgspec is not None:
+    _msgspec_encoder = msgspec.json.Encoder(enc_hook=str)
+    _msgspec_decoder = msgspec.json.Decoder()
+    _JSON_CODECS["msgspec"] = _JsonCodec("msgspec", _msgspec_encoder.encode, _msgspec_decoder.decode)
+
+
+def _select_json_codec(name: str) -> _JsonCodec:
+    name = (name or "auto").strip().lower()
+    if name in _JSON_CODECS:
+        return _JSON_CODECS[name]
+    for candidate in ("orjson", "msgspec", "stdlib"):
+        if candidate in _JSON_CODECS:
+            return _JSON_CODECS[candidate]
+    return _JSON_CODECS["stdlib"]
+
+
+# COE_JSON_CODEC = auto | orjson | msgspec | stdlib
+JSON_CODEC = _select_json_codec(os.getenv("COE_JSON_CODEC", "auto"))
+
+
+def _json_dumps(obj: Any) -> bytes:
+    try:
+        return JSON_CODEC.dumps(obj)
+    except (TypeError, ValueError, OverflowError):
+        # 64bit 초과 정수 등 고속 코덱이 거부하는 값은 stdlib로 처리
+        return _stdlib_dumps(obj)
+
+
+def _json_dumps_text(obj: Any) -> str:
+    return _json_dumps(obj).decode("utf-8")
+
+
+def _json_loads(data: Any) -> Any:
+    return JSON_CODEC.loads(data)
+
+
+# 커넥션 풀 한도 (프로세스 전역, 환경변수로 조정)
+HTTP_MAX_CONNECTIONS = int(os.getenv("COE_HTTP_MAX_CONNECTIONS", "32"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("COE_HTTP_MAX_KEEPALIVE", "16"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("COE_HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP2_DEFAULT = _env_flag("COE_HTTP2")
+
+# urllib 폴백 경로와 httpx 경로에서 연결 실패로 간주할 예외
+_HTTP_ERRORS: Tuple[type, ...] = (URLError, OSError, socket.gaierror)
+if httpx is not None:
+    _HTTP_ERRORS = _HTTP_ERRORS + (httpx.HTTPError,)
+
+
+class _BackendPool:
+    """
+    origin(scheme://host:port) 단위 keep-alive 커넥션 풀.
+    sync 클라이언트 1개 + 이벤트 루프별 async 클라이언트를 두고, 커넥션 재사용 통계를 집계합니다.
+    """
+
+    def __init__(self, origin: str, http2: bool = False) -> None:
+        self.origin = origin
+        self.http2 = bool(http2 and _HAS_H2)
+        self._lock = threading.Lock()
+        self._sync_client: Any = None
+        self._async_clients: Dict[int, Tuple[asyncio.AbstractEventLoop, Any]] = {}
+        self._seen_streams: "weakref.WeakSet[Any]" = weakref.WeakSet()
+        self.requests = 0
+        self.new_connections = 0
+        self.reused_connections = 0
+        self.errors = 0
+
+    def _client_kwargs(self) -> Dict[str, Any]:
+        return {
+            "limits": httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            "http2": self.http2,
+            "headers": {"User-Agent": "langflow"},
+        }
+
+    def sync_client(self) -> Any:
+        with self._lock:
+            if self._sync_client is None or self._sync_client.is_closed:
+                self._sync_client = httpx.Client(**self._client_kwargs())
+            return self._sync_client
+
+    def async_client(self) -> Any:
+        # AsyncClient는 생성된 이벤트 루프에 묶이므로 루프별로 보관
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            for key, (owner, _client) in list(self._async_clients.items()):
+                if owner.is_closed():
+                    del self._async_clients[key]
+            entry = self._async_clients.get(id(loop))
+            if entry is None or entry[0] is not loop or entry[1].is_closed:
+                entry = (loop, httpx.AsyncClient(**self._client_kwargs()))
+                self._async_clients[id(loop)] = entry
+            return entry[1]
+
+    def record(self, response: Any) -> None:
+        stream = (getattr(response, "extensions", None) or {}).get("network_stream")
+        with self._lock:
+            self.requests += 1
+            if stream is None:
+                return
+            try:
+                if stream in self._seen_streams:
+                    self.reused_connections += 1
+                else:
+                    self._seen_streams.add(stream)
+                    self.new_connections += 1
+            except TypeError:
+                pass
+
+    def record_error(self) -> None:
+        with self._lock:
+            self.errors += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            observed = self.new_connections + self.reused_connections
+            return {
+                "origin": self.origin,
+                "http2": self.http2,
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_connections": self.reused_connections,
+                "errors": self.errors,
+                "reuse_ratio": round(self.reused_connections / observed, 4) if observed else 0.0,
+            }
+
+
+_HTTP_POOLS: Dict[Tuple[str, bool], _BackendPool] = {}
+_HTTP_POOLS_LOCK = threading.Lock()
+
+
+def _origin_of(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _get_http_pool(url: str, http2: bool = False) -> _BackendPool:
+    key = (_origin_of(url), bool(http2))
+    with _HTTP_POOLS_LOCK:
+        pool = _HTTP_POOLS.get(key)
+        if pool is None:
+            pool = _HTTP_POOLS[key] = _BackendPool(key[0], http2=http2)
+        return pool
+
+
+def http_pool_stats() -> List[Dict[str, Any]]:
+    """프로세스 내 모든 백엔드 풀의 요청 수/신규·재사용 커넥션/재사용 비율."""
+    with _HTTP_POOLS_LOCK:
+        pools = list(_HTTP_POOLS.values())
+    return [pool.stats() for pool in pools]
+
+
+# 요청 본문 압축: off / auto(zstd → gzip 협상) / gzip / zstd. 임계값 미만 본문은 압축하지 않음
+REQUEST_COMPRESSION_MODES = ("off", "auto", "gzip", "zstd")
+COMPRESSION_MIN_BYTES = int(os.getenv("COE_COMPRESSION_MIN_BYTES", str(16 * 1024)))
+GZIP_LEVEL = int(os.getenv("COE_GZIP_LEVEL", "5"))
+ZSTD_LEVEL = int(os.getenv("COE_ZSTD_LEVEL", "3"))
+# 압축 본문을 풀지 못하는 백엔드(본문을 해제하지 않는 프록시 뒤의 FastAPI 등)가 415 대신 돌려주는 상태 코드
+COMPRESSION_SUSPECT_STATUSES = frozenset({400, 413, 422})
+
+
+class _CompressionNegotiator:
+    """
+    origin별로 백엔드가 거부한(415) 요청 Content-Encoding을 기억합니다.
+    415 응답에 Accept-Encoding(RFC 7694)이 있으면 그 목록을 허용 인코딩으로 사용합니다.
+    압축 요청이 400/413/422로 실패하고 같은 요청을 비압축으로 다시 보내 성공하면 그 인코딩도 거부로 기록합니다.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._rejected: Dict[str, set] = {}
+        self._advertised: Dict[str, List[str]] = {}
+
+    def choose(self, url: str, mode: str) -> Optional[str]:
+        mode = (mode or "off").lower()
+        if mode not in REQUEST_COMPRESSION_MODES or mode == "off":
+            return None
+        origin = _origin_of(url)
+        with self._lock:
+            rejected = set(self._rejected.get(origin, ()))
+            advertised = self._advertised.get(origin)
+        preferred = ["zstd", "gzip"] if mode == "auto" else [mode]
+        for encoding in preferred:
+            if encoding == "zstd" and zstandard is None:
+                continue
+            if encoding in rejected or (advertised is not None and encoding not in advertised):
+                continue
+            return encoding
+        return None
+
+    def reject(self, url: str, encoding: str, accept_encoding: Optional[str] = None) -> None:
+        origin = _origin_of(url)
+        with self._lock:
+            self._rejected.setdefault(origin, set()).add(encoding)
+            if accept_encoding is not None:
+                self._advertised[origin] = [
+                    part.split(";")[0].strip().lower() for part in accept_encoding.split(",") if part.strip()
+                ]
+
+
+_COMPRESSION = _CompressionNegotiator()
+
+
+def _encode_request_body(
+    url: str,
+    body: bytes,
+    compression: str = "off",
+    min_bytes: int = COMPRESSION_MIN_BYTES,
+    meter: Optional[Dict[str, Any]] = None,
+) -> Tuple[bytes, Dict[str, str], Optional[str]]:
+    """(전송 본문, 추가 헤더, 사용한 인코딩). meter에 원본/전송 바이트, 압축률, 압축 CPU 시간을 기록합니다."""
+    encoding = _COMPRESSION.choose(url, compression) if len(body) >= max(0, min_bytes) else None
+    if meter is not None:
+        meter["request_bytes"] = len(body)
+    if encoding is None:
+        if meter is not None:
+            meter["request_wire_bytes"] = len(body)
+        return body, {}, None
+    cpu_started = time.thread_time()
+    if encoding == "zstd":
+        wire = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    else:
+        wire = gzip.compress(body, compresslevel=GZIP_LEVEL)
+    if meter is not None:
+        meter["request_wire_bytes"] = len(wire)
+        meter["compression"] = encoding
+        meter["compression_ratio"] = round(len(body) / max(1, len(wire)), 2)
+        cpu_ms = (time.thread_time() - cpu_started) * 1000
+        meter["compress_cpu_ms"] = round(meter.get("compress_cpu_ms", 0.0) + cpu_ms, 3)
+    return wire, {"Content-Encoding": encoding}, encoding
+
+
+def _decode_response_body(data: bytes, content_encoding: Optional[str]) -> bytes:
+    """urllib 폴백 경로용 응답 압축 해제 (httpx는 자체적으로 처리)."""
+    encoding = (content_encoding or "").strip().lower()
+    if encoding == "gzip":
+        return gzip.decompress(data)
+    if encoding == "zstd" and zstandard is not None:
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return data
+
+
+def _http_get_json(url: str, timeout: float = 8.0, http2: bool = False) -> Dict[str, Any]:
+    if httpx is None:
+        req = urlreq.Request(url, headers={"User-Agent": "langflow", "Accept-Encoding": "gzip"})
+        with urlreq.urlopen(req, timeout=timeout) as r:
+            return _json_loads(_decode_response_body(r.read(), r.headers.get("Content-Encoding")))
+
+    pool = _get_http_pool(url, http2)
+    try:
+        r = pool.sync_client().get(url, timeout=timeout)
+        pool.record(r)
+        r.raise_for_status()
+    except _HTTP_ERRORS:
+        pool.record_error()
+        raise
+    return _json_loads(r.content)
+
+
+def _http_post_json(
+    url: str,
+    payload: Dict[str, Any],
+    timeout: float = 30.0,
+    compression: str = "off",
+    min_compress_bytes: int = COMPRESSION_MIN_BYTES,
+    meter: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    body = _json_dumps(payload)
+    suspect: Optional[str] = None
+    while True:
+        data, extra_headers, encoding = _encode_request_body(url, body, compression, min_compress_bytes, meter)
+        headers = {"Content-Type": "application/json", "User-Agent": "langflow", "Accept-Encoding": "gzip"}
+        req = urlreq.Request(url, data=data, headers={**headers, **extra_headers})
+        try:
+            with urlreq.urlopen(req, timeout=timeout) as r:
+                raw = r.read()
+                if meter is not None:
+                    meter["response_wire_bytes"] = len(raw)
+                content = _decode_response_body(raw, r.headers.get("Content-Encoding"))
+        except HTTPError as e:
+            if e.code == 415 and encoding:
+                _COMPRESSION.reject(url, encoding, e.headers.get("Accept-Encoding"))
+                continue
+            if e.code in COMPRESSION_SUSPECT_STATUSES and encoding:
+                # 압축 본문을 해석하지 못했을 수 있음 → 비압축으로 1회 재전송
+                suspect, compression = encoding, "off"
+                continue
+            raise
+        if suspect:
+            _COMPRESSION.reject(url, suspect)
+        if meter is not None:
+            meter["response_bytes"] = len(content)
+        return _json_loads(content)
+
+
+async def _ahttp_post_json(
+    url: str,
+    payload: Dict[str, Any],
+    timeout: float = 30.0,
+    http2: bool = False,
+    meter: Optional[Dict[str, Any]] = None,
+    compression: str = "off",
+    min_compress_bytes: int = COMPRESSION_MIN_BYTES,
+) -> Dict[str, Any]:
+    """
+    meter가 주어지면 request/response 바이트(원본·전송), 압축률, 압축 CPU 시간을 기록합니다.
+    압축 요청이 415로 거부되면 해당 origin에서 그 인코딩을 끄고 즉시 재전송하고,
+    400/413/422로 실패하면 비압축으로 1회 재전송합니다(성공하면 그 인코딩을 거부로 기록).
+    """
+    if httpx is None:
+        return await asyncio.to_thread(
+            _http_post_json, url, payload, timeout, compression, min_compress_bytes, meter
+        )
+
+    pool = _get_http_pool(url, http2)
+    body = _json_dumps(payload)
+    suspect: Optional[str] = None
+    while True:
+        data, extra_headers, encoding = _encode_request_body(url, body, compression, min_compress_bytes, meter)
+        try:
+            r = await pool.async_client().post(
+                url,
+                content=data,
+                headers={"Content-Type": "application/json", **extra_headers},
+                timeout=timeout,
+            )
+            pool.record(r)
+            if r.status_code == 415 and encoding:
+                _COMPRESSION.reject(url, encoding, r.headers.get("accept-encoding"))
+                continue
+            if r.status_code in COMPRESSION_SUSPECT_STATUSES and encoding:
+                suspect, compression = encoding, "off"
+                continue
+            r.raise_for_status()
+        except _HTTP_ERRORS:
+            pool.record_error()
+            raise
+        if suspect:
+            _COMPRESSION.reject(url, suspect)
+        if meter is not None:
+            meter["response_bytes"] = len(r.content)
+            meter["response_wire_bytes"] = r.num_bytes_downloaded
+        return _json_loads(r.content)
+
+
+def _merge_stream_delta(state: Dict[str, Any], chunk: Dict[str, Any]) -> str:
+    """SSE chunk 하나를 누적 상태에 병합하고, 새로 도착한 텍스트 조각을 반환합니다."""
+    for key in ("id", "model", "created"):
+        if chunk.get(key) is not None:
+            state[key] = chunk[key]
+    if chunk.get("usage"):
+        state["usage"] = chunk["usage"]
+
+    text_delta = ""
+    for choice in chunk.get("choices") or []:
+        if not isinstance(choice, dict) or (choice.get("index") or 0) != 0:
+            continue
+        if choice.get("finish_reason"):
+            state["finish_reason"] = choice["finish_reason"]
+        delta = choice.get("delta") or choice.get("message") or {}
+        if delta.get("role"):
+            state["role"] = delta["role"]
+        piece = delta.get("content")
+        if piece:
+            state["content"].append(piece)
+            text_delta += piece
+        # tool_calls는 index 단위 조각(id/name/arguments)으로 나뉘어 도착
+        for fragment in delta.get("tool_calls") or []:
+            idx = fragment.get("index", len(state["tool_calls"]))
+            call = state["tool_calls"].setdefault(
+                idx, {"id": None, "type": "function", "function": {"name": "", "arguments": ""}}
+            )
+            if fragment.get("id"):
+                call["id"] = fragment["id"]
+            if fragment.get("type"):
+                call["type"] = fragment["type"]
+            fn = fragment.get("function") or {}
+            if fn.get("name"):
+                call["function"]["name"] += fn["name"]
+            if fn.get("arguments"):
+                call["function"]["arguments"] += fn["arguments"]
+    return text_delta
+
+
+def _stream_state_to_response(state: Dict[str, Any]) -> Dict[str, Any]:
+    """누적된 스트림 상태를 비스트리밍 응답과 동일한 형태로 재구성합니다."""
+    message: Dict[str, Any] = {
+        "role": state.get("role") or "assistant",
+        "content": "".join(state["content"]) if state["content"] else None,
+    }
+    tool_calls = [state["tool_calls"][idx] for idx in sorted(state["tool_calls"])]
+    for call in tool_calls:
+        if not call.get("id"):
+            call["id"] = f"call_{uuid.uuid4().hex[:24]}"
+    if tool_calls:
+        message["tool_calls"] = tool_calls
+    elif message["content"] is None:
+        message["content"] = ""
+    response: Dict[str, Any] = {
+        "object": "chat.completion",
+        "choices": [{"index": 0, "message": message, "finish_reason": state.get("finish_reason")}],
+    }
+    for key in ("id", "model", "created", "usage"):
+        if state.get(key) is not None:
+            response[key] = state[key]
+    return response
+
+
+async def _astream_chat_completion(
+    url: str,
+    payload: Dict[str, Any],
+    timeout: float = 30.0,
+    http2: bool = False,
+    on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+    meter: Optional[Dict[str, Any]] = None,
+    compression: str = "off",
+    min_compress_bytes: int = COMPRESSION_MIN_BYTES,
+) -> Dict[str, Any]:
+    """stream=true로 호출하여 SSE delta를 점진적으로 파싱하고 최종 응답 dict를 돌려줍니다."""
+    pool = _get_http_pool(url, http2)
+    state: Dict[str, Any] = {"content": [], "tool_calls": {}}
+    body = _json_dumps(payload)
+    data, extra_headers, encoding = _encode_request_body(url, body, compression, min_compress_bytes, meter)
+    started = time.perf_counter()
+    try:
+        async with pool.async_client().stream(
+            "POST",
+            url,
+            content=data,
+            headers={"Content-Type": "application/json", "Accept": "text/event-stream", **extra_headers},
+            timeout=timeout,
+        ) as r:
+            pool.record(r)
+            if r.status_code == 415 and encoding:
+                _COMPRESSION.reject(url, encoding, r.headers.get("accept-encoding"))
+                await r.aread()
+                return await _astream_chat_completion(
+                    url, payload, timeout, http2, on_delta, meter, compression, min_compress_bytes
+                )
+            if r.status_code in COMPRESSION_SUSPECT_STATUSES and encoding:
+                # 비압축으로 1회 재전송, 성공하면 이 origin에서 해당 인코딩을 끔
+                await r.aread()
+                result = await _astream_chat_completion(url, payload, timeout, http2, on_delta, meter, "off")
+                _COMPRESSION.reject(url, encoding)
+                return result
+            r.raise_for_status()
+            # 서버가 stream 옵션을 무시하고 일반 JSON을 돌려준 경우
+            if "text/event-stream" not in (r.headers.get("content-type") or ""):
+                return _json_loads(await r.aread())
+            async for line in r.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:") :].strip()
+                if not data:
+                    continue
+                if data == "[DONE]":
+                    # 스트림 끝까지 읽어야 커넥션이 풀로 반환되어 재사용됨
+                    continue
+                chunk = _json_loads(data)
+                if not isinstance(chunk, dict):
+                    continue
+                text_delta = _merge_stream_delta(state, chunk)
+                if text_delta and meter is not None and "ttft_ms" not in meter:
+                    meter["ttft_ms"] = round((time.perf_counter() - started) * 1000, 2)
+                if text_delta and on_delta is not None:
+                    await on_delta(text_delta)
+            if meter is not None:
+                meter["response_bytes"] = r.num_bytes_downloaded
+    except _HTTP_ERRORS:
+        pool.record_error()
+        raise
+    return _stream_state_to_response(state)
+
+
+# 모델 목록 캐시 TTL(초). 만료 후에도 이전 목록을 즉시 반환하고 백그라운드에서 갱신
+MODEL_CATALOG_TTL = float(os.getenv("COE_MODEL_CATALOG_TTL", "300"))
+
+
+class _ModelCatalogCache:
+    """
+    정규화된 백엔드 URL별 (name, id) 모델 목록 캐시 (stale-while-revalidate).
+    동일 URL에 대한 동시 조회는 한 번의 fetch를 공유합니다.
+    """
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[float, List[Tuple[str, str]]]] = {}
+        self._inflight: Dict[str, threading.Event] = {}
+
+    def peek(self, base: str) -> Optional[List[Tuple[str, str]]]:
+        with self._lock:
+            entry = self._entries.get(base)
+        return list(entry[1]) if entry else None
+
+    def get(
+        self,
+        base: str,
+        fetch: Callable[[str], List[Tuple[str, str]]],
+        force: bool = False,
+        wait_timeout: float = 20.0,
+    ) -> Tuple[List[Tuple[str, str]], str]:
+        """(pairs, status) 반환. status ∈ {fresh, stale, shared, fetched}. fetch 실패 시 예외 전파."""
+        with self._lock:
+            entry = self._entries.get(base)
+            if entry is not None and not force:
+                if time.monotonic() - entry[0] < self.ttl:
+                    return list(entry[1]), "fresh"
+                if base not in self._inflight:
+                    self._inflight[base] = threading.Event()
+                    threading.Thread(
+                        target=self._refresh, args=(base, fetch), name="coe-model-catalog", daemon=True
+                    ).start()
+                return list(entry[1]), "stale"
+            event = self._inflight.get(base)
+            leader = event is None
+            if leader:
+                event = self._inflight[base] = threading.Event()
+
+        if not leader:
+            event.wait(wait_timeout)
+            shared = self.peek(base)
+            if shared is not None:
+                return shared, "shared"
+            # 선행 fetch가 실패했으면 직접 조회
+            return fetch(base), "fetched"
+
+        try:
+            pairs = fetch(base)
+            self._store(base, pairs)
+            return list(pairs), "fetched"
+        finally:
+            self._release(base)
+
+    def _refresh(self, base: str, fetch: Callable[[str], List[Tuple[str, str]]]) -> None:
+        try:
+            self._store(base, fetch(base))
+        except Exception:
+            # 갱신 실패 시 이전 목록을 유지 (다음 조회 때 재시도)
+            pass
+        finally:
+            self._release(base)
+
+    def _store(self, base: str, pairs: List[Tuple[str, str]]) -> None:
+        with self._lock:
+            self._entries[base] = (time.monotonic(), list(pairs))
+
+    def _release(self, base: str) -> None:
+        with self._lock:
+            event = self._inflight.pop(base, None)
+        if event is not None:
+            event.set()
+
+
+_MODEL_CATALOG = _ModelCatalogCache(MODEL_CATALOG_TTL)
+
+
+# 직렬화된 OpenAI tool 스키마 캐시: (id(tool), fingerprint) -> {"type": "function", ...}
+TOOL_SCHEMA_CACHE_SIZE = 512
+_TOOL_SCHEMA_CACHE: "OrderedDict[Tuple[Any, ...], Dict[str, Any]]" = OrderedDict()
+_TOOL_SCHEMA_LOCK = threading.Lock()
+
+
+def _tool_fingerprint(tool: Any) -> Tuple[Any, ...]:
+    """
+    스키마 생성 없이 계산 가능한 도구 정의 지문.
+    이름/설명/args_schema 클래스와 필드 정의가 바뀌면 값이 달라집니다.
+    """
+    args_schema = getattr(tool, "args_schema", None)
+    if isinstance(args_schema, dict):
+        fields: Tuple[Any, ...] = (json.dumps(args_schema, sort_keys=True, default=str),)
+    else:
+        raw_fields = getattr(args_schema, "model_fields", None) or getattr(args_schema, "__fields__", None) or {}
+        try:
+            fields = tuple(sorted((str(k), repr(v)) for k, v in raw_fields.items()))
+        except Exception:
+            fields = ()
+    return (
+        str(getattr(tool, "name", None) or ""),
+        str(getattr(tool, "description", "") or ""),
+        id(args_schema) if args_schema is not None else None,
+        fields,
+    )
+
+
+def _canonicalize(value: Any, key: str = "") -> Any:
+    """
+    dict 키를 정렬한 사본을 반환합니다(JSON Schema의 required 목록도 정렬).
+    논리적으로 같은 스키마가 항상 같은 바이트열로 직렬화되어 백엔드 prefix 캐시가 적중하도록 합니다.
+    """
+    if isinstance(value, dict):
+        return {k: _canonicalize(value[k], str(k)) for k in sorted(value, key=str)}
+    if isinstance(value, (list, tuple)):
+        if key == "required" and all(isinstance(v, str) for v in value):
+            return sorted(value)
+        return [_canonicalize(v) for v in value]
+    return value
+
+
+def _prefix_fingerprint(model: str, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]]) -> str:
+    """모델 + 선두 system 메시지 + tools로 이루어진 고정 prefix의 지문(sha256 앞 16자리)."""
+    system = []
+    for message in messages:
+        if message.get("role") != "system":
+            break
+        system.append(message.get("content"))
+    raw = json.dumps([model, system, tools], ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def _serialize_tool(tool: Any, fingerprint: Optional[Tuple[Any, ...]] = None) -> Dict[str, Any]:
+    """도구 1개를 OpenAI tool 포맷으로 직렬화(지문 기준 메모이즈)."""
+    fingerprint = fingerprint or _tool_fingerprint(tool)
+    key = (id(tool), fingerprint)
+    with _TOOL_SCHEMA_LOCK:
+        cached = _TOOL_SCHEMA_CACHE.get(key)
+        if cached is not None:
+            _TOOL_SCHEMA_CACHE.move_to_end(key)
+            return cached
+
+    args_schema = getattr(tool, "args_schema", None)
+    if isinstance(args_schema, dict):
+        schema = args_schema
+    elif args_schema is not None:
+        try:
+            schema = args_schema.schema()
+        except Exception:
+            schema = {"type": "object", "properties": {}}
+    else:
+        schema = {"type": "object", "properties": {}}
+
+    entry = {
+        "type": "function",
+        "function": {
+            "name": fingerprint[0],
+            "description": fingerprint[1],
+            "parameters": _canonicalize(schema),
+        },
+    }
+    with _TOOL_SCHEMA_LOCK:
+        _TOOL_SCHEMA_CACHE[key] = entry
+        while len(_TOOL_SCHEMA_CACHE) > TOOL_SCHEMA_CACHE_SIZE:
+            _TOOL_SCHEMA_CACHE.popitem(last=False)
+    return entry
+
+
+def _tool_definition_digest(tool: Any) -> str:
+    """
+    직렬화된 도구 정의(이름/설명/정규화된 JSON Schema)의 내용 지문.
+    객체 id와 무관하므로 그래프 빌드마다 도구/args_schema가 새로 만들어져도 같은 값입니다.
+    """
+    raw = json.dumps(_serialize_tool(tool), ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+# 응답 캐시 기본값 (입력으로 TTL/개수/디스크 경로 조정)
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("COE_RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+def _response_cache_key(signature: Tuple[Any, ...], model_id: str) -> str:
+    raw = json.dumps([list(signature), model_id], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _ResponseCache:
+    """
+    요청 시그니처 해시 → 최종 응답 payload 캐시.
+    메모리 LRU(개수/바이트 한도) + 엔트리별 TTL, 선택적으로 SQLite 디스크 계층을 둡니다.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path or None
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+        self._bytes = 0
+        self._db: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.path:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS coe_response_cache "
+                "(key TEXT PRIMARY KEY, expires_at REAL NOT NULL, body TEXT NOT NULL)"
+            )
+            self._db.commit()
+
+    def get(self, key: str, max_entries: int = 256) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[2]
+                self._drop(key)
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT expires_at, body FROM coe_response_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[0] > now:
+                    payload = _json_loads(row[1])
+                    self._put_memory(key, row[0], len(row[1]), payload)
+                    self._evict(max_entries)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return payload
+            self.misses += 1
+            return None
+
+    def put(self, key: str, payload: Dict[str, Any], ttl: float, max_entries: int) -> None:
+        if ttl <= 0:
+            return
+        try:
+            body = _json_dumps(payload)
+        except Exception:
+            return
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._put_memory(key, expires_at, len(body), payload)
+            self._evict(max_entries)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO coe_response_cache (key, expires_at, body) VALUES (?, ?, ?)",
+                    (key, expires_at, body),
+                )
+                self._db.execute("DELETE FROM coe_response_cache WHERE expires_at <= ?", (time.time(),))
+                self._db.commit()
+
+    def _put_memory(self, key: str, expires_at: float, size: int, payload: Dict[str, Any]) -> None:
+        self._drop(key)
+        self._entries[key] = (expires_at, size, payload)
+        self._bytes += size
+
+    def _evict(self, max_entries: int) -> None:
+        while self._entries and (len(self._entries) > max(1, max_entries) or self._bytes > RESPONSE_CACHE_MAX_BYTES):
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "path": self.path,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+_RESPONSE_CACHES: Dict[Optional[str], _ResponseCache] = {}
+_RESPONSE_CACHES_LOCK = threading.Lock()
+
+
+def _get_response_cache(path: Optional[str] = None) -> _ResponseCache:
+    path = (path or "").strip() or None
+    with _RESPONSE_CACHES_LOCK:
+        cache = _RESPONSE_CACHES.get(path)
+        if cache is None:
+            cache = _RESPONSE_CACHES[path] = _ResponseCache(path)
+        return cache
+
+
+def response_cache_stats() -> List[Dict[str, Any]]:
+    """응답 캐시(메모리/디스크 계층별) hit/miss 카운터."""
+    with _RESPONSE_CACHES_LOCK:
+        caches = list(_RESPONSE_CACHES.values())
+    return [cache.stats() for cache in caches]
+
+
+class _LeaderCancelled(Exception):
+    """single-flight 리더 실행이 취소됨 (대기자는 스스로 다시 실행)."""
+
+
+class _SingleFlight:
+    """동일 키로 동시에 들어온 호출을 하나의 실행으로 합치고 결과를 공유합니다(이벤트 루프 단위)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._inflight: Dict[Tuple[int, str], "asyncio.Future[Any]"] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """(result, coalesced) 반환. coalesced=True면 다른 호출의 결과를 기다려 받은 것."""
+        loop = asyncio.get_running_loop()
+        slot = (id(loop), key)
+        while True:
+            with self._lock:
+                future = self._inflight.get(slot)
+                leader = future is None
+                if leader:
+                    future = loop.create_future()
+                    # 대기자가 없을 때 'exception was never retrieved' 경고 방지
+                    future.add_done_callback(lambda f: f.cancelled() or f.exception())
+                    self._inflight[slot] = future
+                    self.leaders += 1
+                else:
+                    self.coalesced += 1
+            if leader:
+                break
+            try:
+                # 대기자 취소가 공유 실행을 취소하지 않도록 shield
+                return await asyncio.shield(future), True
+            except _LeaderCancelled:
+                # 리더 쪽 취소(타임아웃 등)는 대기자에게 전파하지 않고, 대기자 중 하나가 새 리더로 다시 실행
+                continue
+
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            future.set_exception(_LeaderCancelled())
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                if self._inflight.get(slot) is future:
+                    del self._inflight[slot]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._inflight)}
+
+
+_CHAT_SINGLE_FLIGHT = _SingleFlight()
+_TOOL_SINGLE_FLIGHT = _SingleFlight()
+
+
+# 동기 도구 실행용 executor (프로세스 전역, (종류, worker 수) 별로 공유)
+TOOL_PROCESS_WORKERS = int(os.getenv("COE_TOOL_PROCESS_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+_TOOL_EXECUTORS: Dict[Tuple[str, int], Executor] = {}
+_TOOL_SEMAPHORES: Dict[Tuple[int, str, int], asyncio.Semaphore] = {}
+_TOOL_RUNTIME_LOCK = threading.Lock()
+
+
+def _get_tool_executor(kind: str, workers: int) -> Executor:
+    key = (kind, max(1, int(workers)))
+    with _TOOL_RUNTIME_LOCK:
+        executor = _TOOL_EXECUTORS.get(key)
+        if executor is None:
+            if kind == "process":
+                executor = ProcessPoolExecutor(max_workers=key[1])
+            else:
+                executor = ThreadPoolExecutor(max_workers=key[1], thread_name_prefix="coe-tool")
+            _TOOL_EXECUTORS[key] = executor
+        return executor
+
+
+def _get_tool_semaphore(name: str, limit: int) -> asyncio.Semaphore:
+    """도구 이름별 동시 실행 제한 (워커 내 모든 플로우가 공유, 이벤트 루프 단위)."""
+    key = (id(asyncio.get_running_loop()), name, limit)
+    with _TOOL_RUNTIME_LOCK:
+        semaphore = _TOOL_SEMAPHORES.get(key)
+        if semaphore is None:
+            semaphore = _TOOL_SEMAPHORES[key] = asyncio.Semaphore(limit)
+        return semaphore
+
+
+def _is_sync_tool(tool: Any) -> bool:
+    # StructuredTool(func만 있고 coroutine 없음)은 ainvoke가 기본 executor로 넘기므로 동기 도구로 취급
+    if getattr(tool, "coroutine", False) is None and callable(getattr(tool, "func", None)):
+        return True
+    return not (callable(getattr(tool, "ainvoke", None)) or callable(getattr(tool, "arun", None)))
+
+
+def _release_when_done(loop: asyncio.AbstractEventLoop, semaphore: asyncio.Semaphore) -> Callable[[Any], None]:
+    """executor future 완료 시(작업 스레드에서 호출) 이벤트 루프에서 세마포어를 반환하는 콜백."""
+
+    def _callback(_: Any) -> None:
+        try:
+            loop.call_soon_threadsafe(semaphore.release)
+        except RuntimeError:
+            # 루프가 이미 닫힘 → 세마포어도 함께 버려짐
+            pass
+
+    return _callback
+
+
+def _run_sync_tool(tool: Any, arguments: Dict[str, Any]) -> Tuple[Any, float, float]:
+    """executor(스레드/프로세스)에서 실행. (결과, 시작 시각, 종료 시각) 반환."""
+    started = time.time()
+    if hasattr(tool, "invoke") and callable(getattr(tool, "invoke")):
+        result = tool.invoke(arguments)
+    elif hasattr(tool, "run") and callable(getattr(tool, "run")):
+        result = tool.run(**arguments)
+    elif callable(tool):
+        result = tool(**arguments)
+    else:
+        raise RuntimeError("Tool object is not callable")
+    return result, started, time.time()
+
+
+# 결정적 도구 결과 캐시: (도구 이름, 도구 정의 지문, 정규화된 인자) → 포맷된 출력 텍스트
+TOOL_RESULT_CACHE_MAX_BYTES = int(os.getenv("COE_TOOL_RESULT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+
+def _tool_result_key(tool: Any, name: str, arguments: Dict[str, Any]) -> str:
+    raw = json.dumps(
+        [name, _tool_definition_digest(tool), _canonicalize(arguments)],
+        ensure_ascii=False,
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _ToolResultCache:
+    """도구 결과 LRU (개수/바이트 한도 + 엔트리별 TTL, 프로세스 전역). 오류 결과는 저장하지 않습니다."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+
+    def put(self, key: str, text: str, ttl: float, max_entries: int) -> None:
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (time.monotonic() + ttl, text)
+            self._bytes += len(text)
+            while self._entries and (
+                len(self._entries) > max(1, max_entries) or self._bytes > TOOL_RESULT_CACHE_MAX_BYTES
+            ):
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+_TOOL_RESULTS = _ToolResultCache()
+
+
+def tool_result_cache_stats() -> Dict[str, Any]:
+    """도구 결과 캐시 항목 수/바이트/hit·miss."""
+    return _TOOL_RESULTS.stats()
+
+
+# 엔드포인트 서킷 브레이커: 연결 실패 시 open, backoff 경과 후 half-open에서 1회 탐색
+ENDPOINT_BACKOFF_BASE = float(os.getenv("COE_ENDPOINT_BACKOFF_BASE", "5"))
+ENDPOINT_BACKOFF_MAX = float(os.getenv("COE_ENDPOINT_BACKOFF_MAX", "300"))
+# half-open 탐색 1건의 점유 시간: 결과가 기록되지 않으면(취소 등) 이 시간이 지난 뒤 다른 호출이 탐색
+ENDPOINT_PROBE_LEASE = float(os.getenv("COE_ENDPOINT_PROBE_LEASE", "30"))
+
+
+def _is_status_error(error: BaseException) -> bool:
+    """HTTP 상태 코드 오류(서버에는 도달함)인지 여부. 브레이커 실패로 세지 않습니다."""
+    if isinstance(error, HTTPError):
+        return True
+    return httpx is not None and isinstance(error, httpx.HTTPStatusError)
+
+
+def _error_status(error: BaseException) -> Optional[int]:
+    if isinstance(error, HTTPError):
+        return int(error.code)
+    if httpx is not None and isinstance(error, httpx.HTTPStatusError):
+        return int(error.response.status_code)
+    return None
+
+
+def _retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Retry-After 헤더(초 또는 HTTP-date)를 초 단위로 변환합니다."""
+    headers = None
+    if isinstance(error, HTTPError):
+        headers = error.headers
+    elif httpx is not None and isinstance(error, httpx.HTTPStatusError):
+        headers = error.response.headers
+    raw = (headers.get("Retry-After") if headers is not None else None) or ""
+    raw = str(raw).strip()
+    if not raw:
+        return None
+    try:
+        return max(0.0, float(raw))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(raw).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+def _parse_status_classes(spec: str) -> frozenset:
+    """'429,502-504,5xx' 형태의 상태 코드 목록을 집합으로 변환합니다."""
+    codes: set = set()
+    for token in str(spec or "").replace(";", ",").split(","):
+        token = token.strip().lower()
+        if not token:
+            continue
+        try:
+            if len(token) == 3 and token.endswith("xx") and token[0].isdigit():
+                start = int(token[0]) * 100
+                codes.update(range(start, start + 100))
+            elif "-" in token:
+                low, high = (int(part) for part in token.split("-", 1))
+                codes.update(range(low, high + 1))
+            else:
+                codes.add(int(token))
+        except ValueError:
+            continue
+    return frozenset(codes)
+
+
+class _RetryPolicy:
+    """
+    chat dispatch 재시도 정책.
+    지정된 상태 코드/연결 오류만 재시도하고, Retry-After가 있으면 따르며 없으면 full-jitter 지수 backoff.
+    """
+
+    MAX_RETRY_AFTER = 60.0
+
+    def __init__(
+        self,
+        max_retries: int = 2,
+        retry_statuses: frozenset = frozenset({429, 502, 503, 504}),
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+    ) -> None:
+        self.max_retries = max(0, int(max_retries))
+        self.retry_statuses = retry_statuses
+        self.base_delay = max(0.0, float(base_delay))
+        self.max_delay = max(self.base_delay, float(max_delay))
+
+    def should_retry(self, error: BaseException, retries_done: int) -> bool:
+        if retries_done >= self.max_retries:
+            return False
+        status = _error_status(error)
+        if status is not None:
+            return status in self.retry_statuses
+        # 타임아웃은 재시도하지 않음(헤징이 꼬리 지연을 담당)
+        if httpx is not None and isinstance(error, httpx.TimeoutException):
+            return False
+        return isinstance(error, _HTTP_ERRORS)
+
+    def delay(self, error: BaseException, retries_done: int) -> float:
+        retry_after = _retry_after_seconds(error)
+        if retry_after is not None:
+            return min(retry_after, self.MAX_RETRY_AFTER)
+        cap = min(self.max_delay, self.base_delay * (2 ** retries_done))
+        return random.uniform(0, cap)
+
+
+class _LatencyWindow:
+    """엔드포인트별 최근 dispatch 지연 슬라이딩 윈도우 (헤징 지연 산출용)."""
+
+    def __init__(self, size: int = 200) -> None:
+        self._lock = threading.Lock()
+        self._samples: Dict[str, "deque[float]"] = {}
+        self._size = size
+
+    def record(self, key: str, seconds: float) -> None:
+        with self._lock:
+            window = self._samples.get(key)
+            if window is None:
+                window = self._samples[key] = deque(maxlen=self._size)
+            window.append(seconds)
+
+    def quantile(self, key: str, q: float, min_samples: int = 20) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(key) or ())
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+_DISPATCH_LATENCY = _LatencyWindow()
+
+
+async def _hedged_call(factory: Callable[[], Awaitable[Any]], hedge_delay: float) -> Tuple[Any, bool]:
+    """
+    factory()를 실행하고 hedge_delay 안에 끝나지 않으면 동일 요청을 하나 더 시작합니다.
+    먼저 성공한 결과를 쓰고 나머지는 취소합니다. (result, hedge_won) 반환.
+    """
+    first = asyncio.ensure_future(factory())
+    pending = {first}
+    # 호출자 취소(deadline 등) 시에도 진행 중인 요청이 남지 않도록 전체를 finally로 감쌈
+    try:
+        done, _ = await asyncio.wait({first}, timeout=hedge_delay)
+        if done:
+            return first.result(), False
+
+        second = asyncio.ensure_future(factory())
+        pending = {first, second}
+        last_error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), task is second
+                last_error = task.exception()
+        raise last_error or RuntimeError("hedged request failed")
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+class _CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_until = 0.0
+        self.backoff = 0.0
+        self.probe_until = 0.0
+
+    def allow(self, now: float) -> bool:
+        """요청을 보내도 되는지. half-open에서는 진행 중인 탐색이 없을 때만 True (탐색권은 claim_probe로 확보)."""
+        if self.state == self.OPEN and now >= self.opened_until:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            return now >= self.probe_until
+        return self.state != self.OPEN
+
+    def claim_probe(self, now: float) -> bool:
+        """half-open 탐색권을 1건만 발급합니다."""
+        if not self.allow(now) or self.state != self.HALF_OPEN:
+            return False
+        self.probe_until = now + ENDPOINT_PROBE_LEASE
+        return True
+
+    def on_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self.backoff = 0.0
+        self.probe_until = 0.0
+
+    def on_failure(self, now: float) -> None:
+        self.probe_until = 0.0
+        self.failures += 1
+        self.backoff = min(ENDPOINT_BACKOFF_MAX, max(ENDPOINT_BACKOFF_BASE, self.backoff * 2))
+        self.state = self.OPEN
+        self.opened_until = now + self.backoff
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "backoff_s": self.backoff,
+            "retry_in_s": round(max(0.0, self.opened_until - time.monotonic()), 2) if self.state == self.OPEN else 0.0,
+        }
+
+
+class _EndpointResolver:
+    """
+    설정된 base URL과 대체 URL(docker bridge 등) 중 실제로 동작하는 쪽을 기억합니다.
+    실패한 엔드포인트는 지수 backoff 동안 건너뛰고, 설정된 기본 URL은 backoff 경과 시 우선 탐색합니다.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._breakers: Dict[str, _CircuitBreaker] = {}
+        self._preferred: Dict[str, str] = {}
+
+    def _breaker(self, endpoint: str) -> _CircuitBreaker:
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            breaker = self._breakers[endpoint] = _CircuitBreaker()
+        return breaker
+
+    def candidates(self, endpoints: List[str]) -> List[str]:
+        """시도 순서대로 정렬된 엔드포인트 목록 (endpoints[0]이 설정값)."""
+        unique: List[str] = []
+        for endpoint in endpoints:
+            if endpoint and endpoint not in unique:
+                unique.append(endpoint)
+        if not unique:
+            return []
+        primary = unique[0]
+        now = time.monotonic()
+        with self._lock:
+            preferred = self._preferred.get(primary, primary)
+            ordered = [preferred] + [e for e in unique if e != preferred]
+            # backoff가 끝난(half-open) 기본 URL은 복구 여부 확인을 위해 한 호출만 먼저 탐색하고,
+            # 탐색이 진행 중인 동안 나머지 호출은 선호 엔드포인트로 보냄
+            probe = [primary] if self._breaker(primary).claim_probe(now) else []
+            allowed = probe + [e for e in ordered if e not in probe and self._admit(e, now)]
+            if allowed:
+                return allowed
+            # 모두 open이면 가장 먼저 풀리는 엔드포인트부터 시도
+            return sorted(ordered, key=lambda e: self._breaker(e).opened_until)
+
+    def _admit(self, endpoint: str, now: float) -> bool:
+        breaker = self._breaker(endpoint)
+        if breaker.allow(now) and breaker.state == _CircuitBreaker.HALF_OPEN:
+            return breaker.claim_probe(now)
+        return breaker.allow(now)
+
+    def available(self, endpoint: str) -> bool:
+        """서킷이 열려 있지 않은(또는 half-open으로 전환 가능한) 엔드포인트인지."""
+        with self._lock:
+            return self._breaker(endpoint).allow(time.monotonic())
+
+    def record_success(self, primary: str, endpoint: str) -> None:
+        with self._lock:
+            self._breaker(endpoint).on_success()
+            self._preferred[primary] = endpoint
+
+    def record_failure(self, primary: str, endpoint: str, error: Optional[BaseException] = None) -> None:
+        if error is not None and _is_status_error(error):
+            return
+        with self._lock:
+            self._breaker(endpoint).on_failure(time.monotonic())
+            if self._preferred.get(primary) == endpoint:
+                del self._preferred[primary]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "preferred": dict(self._preferred),
+                "breakers": {e: b.snapshot() for e, b in self._breakers.items()},
+            }
+
+
+_ENDPOINTS = _EndpointResolver()
+
+
+def endpoint_stats() -> Dict[str, Any]:
+    """엔드포인트별 서킷 브레이커 상태와 기억된 선호 엔드포인트."""
+    return _ENDPOINTS.stats()
+
+
+# 여러 CoE 백엔드 간 부하 분산 정책
+BALANCE_POLICIES = ("least_outstanding", "p2c")
+BACKEND_EWMA_ALPHA = 0.3
+
+
+class _BackendBalancer:
+    """
+    backend_url에 여러 백엔드가 주어졌을 때 요청을 분산합니다.
+    프로세스 전역으로 백엔드별 진행 중 요청 수와 지연 EWMA를 추적합니다.
+      - least_outstanding: 진행 중 요청이 가장 적은 백엔드 (동률이면 지연 EWMA가 낮은 쪽)
+      - p2c: 무작위로 고른 두 백엔드 중 진행 중 요청이 적은 쪽 (power of two choices)
+    서킷이 열린 백엔드는 건강한 백엔드가 모두 실패했을 때만 시도합니다.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._outstanding: Dict[str, int] = {}
+        self._latency: Dict[str, float] = {}
+        self._requests: Dict[str, int] = {}
+        self._failures: Dict[str, int] = {}
+
+    def _key(self, backend: str) -> Tuple[int, float]:
+        return self._outstanding.get(backend, 0), self._latency.get(backend, 0.0)
+
+    def order(self, groups: Dict[str, List[str]], policy: str) -> List[str]:
+        """groups: 백엔드 → [기본 URL, 대체 URL...]. 시도 순서대로 정렬된 백엔드 목록을 반환합니다."""
+        backends = list(groups)
+        if len(backends) <= 1:
+            return backends
+        healthy = [b for b in backends if any(_ENDPOINTS.available(e) for e in groups[b])]
+        unhealthy = [b for b in backends if b not in healthy]
+        with self._lock:
+            ranked = sorted(healthy, key=self._key)
+            if policy == "p2c" and len(healthy) >= 2:
+                first = min(random.sample(healthy, 2), key=self._key)
+                ranked = [first] + [b for b in ranked if b != first]
+        return ranked + unhealthy
+
+    def acquire(self, backend: str) -> int:
+        """진행 중 요청 수를 올리고, 올리기 전 값을 반환합니다(계측용)."""
+        with self._lock:
+            outstanding = self._outstanding.get(backend, 0)
+            self._outstanding[backend] = outstanding + 1
+            self._requests[backend] = self._requests.get(backend, 0) + 1
+            return outstanding
+
+    def release(self, backend: str, seconds: float, ok: Optional[bool]) -> None:
+        """진행 중 요청 1건을 반환합니다. ok=None(의도적 취소)은 지연/실패 통계에 반영하지 않습니다."""
+        with self._lock:
+            self._outstanding[backend] = max(0, self._outstanding.get(backend, 1) - 1)
+            if ok is None:
+                return
+            if ok:
+                previous = self._latency.get(backend)
+                self._latency[backend] = (
+                    seconds if previous is None else previous + BACKEND_EWMA_ALPHA * (seconds - previous)
+                )
+            else:
+                self._failures[backend] = self._failures.get(backend, 0) + 1
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                backend: {
+                    "outstanding": self._outstanding.get(backend, 0),
+                    "requests": requests,
+                    "failures": self._failures.get(backend, 0),
+                    "latency_ms": round(self._latency.get(backend, 0.0) * 1000, 2),
+                }
+                for backend, requests in self._requests.items()
+            }
+
+
+_BACKENDS = _BackendBalancer()
+
+
+def backend_stats() -> Dict[str, Dict[str, Any]]:
+    """백엔드별 진행 중 요청 수/누적 요청·실패 수/지연 EWMA(ms)."""
+    return _BACKENDS.stats()
+
+
+def _estimate_tokens(text: Any) -> int:
+    """
+    토크나이저 없이 쓰는 보수적 토큰 추정치.
+    ASCII는 4자당 1토큰, 한글 등 비ASCII는 글자당 1토큰으로 계산합니다.
+    """
+    if not text:
+        return 0
+    if not isinstance(text, str):
+        text = _json_dumps_text(text)
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return ascii_chars // 4 + (len(text) - ascii_chars) + 1
+
+
+def _message_tokens(message: Dict[str, Any]) -> int:
+    tokens = 4 + _estimate_tokens(message.get("content"))
+    if message.get("tool_calls"):
+        tokens += _estimate_tokens(message["tool_calls"])
+    return tokens
+
+
+class _ContextBudget:
+    """
+    도구 루프에서 재전송되는 대화의 토큰 예산을 관리합니다.
+      - 너무 큰 도구 출력은 앞/뒤만 남기고 잘라냅니다.
+      - 예산 초과 시 오래된 (assistant tool_calls + tool 응답) 묶음을 요약 1건으로 대체합니다.
+    """
+
+    SUMMARY_SNIPPET_CHARS = 160
+
+    def __init__(self, max_tokens: int, max_tool_tokens: int) -> None:
+        self.max_tokens = max(0, int(max_tokens or 0))
+        self.max_tool_tokens = max(0, int(max_tool_tokens or 0))
+
+    def clip_tool_output(self, text: str) -> str:
+        if not self.max_tool_tokens or not text:
+            return text
+        tokens = _estimate_tokens(text)
+        if tokens <= self.max_tool_tokens:
+            return text
+        keep = max(1, int(len(text) * self.max_tool_tokens / tokens))
+        head = text[: keep * 3 // 4]
+        tail = text[len(text) - keep // 4 :] if keep // 4 else ""
+        return f"{head}\n[... {len(text) - len(head) - len(tail)} chars truncated ...]\n{tail}"
+
+    def compact(
+        self, conversation: List[Dict[str, Any]], pinned: Optional[int] = None
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        (전송할 메시지 목록, 요약으로 대체된 묶음 수) 반환. 원본 conversation은 변경하지 않습니다.
+        pinned가 주어지면 선두 pinned개 메시지(세션 기록 + 현재 질문)를 고정 구간으로 취급합니다.
+        """
+        if not self.max_tokens:
+            return conversation, 0
+        total = sum(_message_tokens(m) for m in conversation)
+        if total <= self.max_tokens:
+            return conversation, 0
+
+        # 선두 system/user(현재 질문)는 고정, 이후를 assistant 기준 묶음으로 분할
+        head_len = 0
+        if pinned is not None:
+            head_len = min(pinned, len(conversation))
+        while head_len < len(conversation) and conversation[head_len].get("role") in {"system", "user"}:
+            head_len += 1
+        head = conversation[:head_len]
+        groups: List[List[Dict[str, Any]]] = []
+        for message in conversation[head_len:]:
+            if message.get("role") == "assistant" or not groups:
+                groups.append([message])
+            else:
+                groups[-1].append(message)
+
+        # 최신 묶음은 유지하고, 오래된 묶음부터 요약 줄로 대체 (요약 크기도 예산에 포함)
+        header = "[context compacted] Earlier tool results:"
+        lines: List[str] = []
+        dropped = 0
+        while len(groups) > 1 and total > self.max_tokens:
+            group = groups.pop(0)
+            dropped += 1
+            total -= sum(_message_tokens(m) for m in group)
+            if dropped == 1:
+                total += _message_tokens({"content": header})
+            for message in group:
+                if message.get("role") == "tool":
+                    snippet = str(message.get("content") or "")[: self.SUMMARY_SNIPPET_CHARS]
+                    lines.append(f"- {message.get('name') or 'tool'}: {snippet}")
+                    total += _estimate_tokens(lines[-1])
+
+        compacted = list(head)
+        if dropped:
+            compacted.append({"role": "assistant", "content": "\n".join([header] + lines)})
+        for group in groups:
+            compacted.extend(group)
+        return compacted, dropped
+
+
+_PROM_METRICS: Dict[str, Any] = {}
+
+
+def _prom_histogram(name: str, doc: str, labels: List[str], buckets: Tuple[float, ...]) -> Any:
+    if _PromHistogram is None:
+        return None
+    metric = _PROM_METRICS.get(name)
+    if metric is None:
+        try:
+            metric = _PromHistogram(name, doc, labels, buckets=buckets)
+        except ValueError:
+            # Langflow가 컴포넌트 코드를 다시 로드한 경우 이미 등록된 collector 재사용
+            metric = getattr(_PROM_REGISTRY, "_names_to_collectors", {}).get(name)
+        _PROM_METRICS[name] = metric
+    return metric
+
+
+def _observe_phase(phase: str, seconds: float, attrs: Optional[Dict[str, Any]] = None) -> None:
+    histogram = _prom_histogram(
+        "coe_model_picker_phase_seconds",
+        "CoEModelPicker latency per phase",
+        ["phase"],
+        (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+    )
+    if histogram is not None:
+        histogram.labels(phase=phase).observe(seconds)
+    for direction in ("request", "response"):
+        size = (attrs or {}).get(f"{direction}_bytes")
+        if size:
+            sizes = _prom_histogram(
+                "coe_model_picker_payload_bytes",
+                "CoEModelPicker backend payload size",
+                ["direction"],
+                (1e3, 1e4, 5e4, 1e5, 5e5, 1e6, 5e6),
+            )
+            if sizes is not None:
+                sizes.labels(direction=direction).observe(size)
+    ratio = (attrs or {}).get("compression_ratio")
+    if ratio:
+        ratios = _prom_histogram(
+            "coe_model_picker_compression_ratio",
+            "CoEModelPicker request body compression ratio (original / wire)",
+            ["encoding"],
+            (1, 1.5, 2, 3, 5, 8, 12, 20),
+        )
+        if ratios is not None:
+            ratios.labels(encoding=str(attrs.get("compression"))).observe(ratio)
+
+
+class _Trace:
+    """
+    _call_chat 1회의 단계별 span 기록기.
+    span은 Prometheus 히스토그램/OpenTelemetry span으로 내보내고, 요약은 Message data에 붙입니다.
+    """
+
+    def __init__(self, name: str = "coe_model_picker.call_chat") -> None:
+        self.spans: List[Dict[str, Any]] = []
+        self._started = time.perf_counter()
+        self._tracer = _otel_trace.get_tracer("coe_model_picker") if _otel_trace is not None else None
+        self._root = self._tracer.start_span(name) if self._tracer is not None else None
+
+    @contextmanager
+    def span(self, phase: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+        """블록 실행 시간을 측정합니다. yield된 dict에 속성(바이트 수, 재시도 등)을 추가할 수 있습니다."""
+        start_ns = time.time_ns()
+        started = time.perf_counter()
+        try:
+            yield attrs
+        except BaseException as e:
+            attrs["error"] = type(e).__name__
+            raise
+        finally:
+            self.record(phase, time.perf_counter() - started, attrs, start_ns)
 
-from langflow.custom.custom_component.component import Component, _get_component_toolkit
-from langflow.inputs.inputs import BoolInput, MessageInput, MultilineInput
-from langflow.io import DropdownInput, Output
+    def record(self, phase: str, seconds: float, attrs: Dict[str, Any], start_ns: Optional[int] = None) -> None:
+        self.spans.append({"phase": phase, "ms": round(seconds * 1000, 2), **attrs})
+        _observe_phase(phase, seconds, attrs)
+        if self._tracer is not None:
+            start_ns = start_ns or time.time_ns() - int(seconds * 1e9)
+            span = self._tracer.start_span(
+                f"coe.{phase}",
+                context=_otel_trace.set_span_in_context(self._root) if self._root is not None else None,
+                start_time=start_ns,
+                attributes={k: v for k, v in attrs.items() if isinstance(v, (str, bool, int, float))},
+            )
+            span.end(end_time=start_ns + int(seconds * 1e9))
 
-# ✅ tools 입력 활성화를 위해 추가
-from langflow.base.agents.agent import LCToolsAgentComponent
-from langflow.field_typing import Tool  # noqa: F401  (입력 타입 선언용)
+    def summary(self) -> Dict[str, Any]:
+        phases: Dict[str, Dict[str, Any]] = {}
+        totals: Dict[str, Any] = {
+            "iterations": 0,
+            "retries": 0,
+            "request_bytes": 0,
+            "request_wire_bytes": 0,
+            "response_bytes": 0,
+            "compress_cpu_ms": 0.0,
+        }
+        for span in self.spans:
+            entry = phases.setdefault(span["phase"], {"count": 0, "ms": 0.0})
+            entry["count"] += 1
+            entry["ms"] = round(entry["ms"] + span["ms"], 2)
+            totals["iterations"] = max(totals["iterations"], int(span.get("iteration") or 0))
+            totals["retries"] += int(span.get("retries") or 0)
+            totals["request_bytes"] += int(span.get("request_bytes") or 0)
+            totals["request_wire_bytes"] += int(span.get("request_wire_bytes") or 0)
+            totals["response_bytes"] += int(span.get("response_bytes") or 0)
+            totals["compress_cpu_ms"] = round(totals["compress_cpu_ms"] + float(span.get("compress_cpu_ms") or 0), 3)
+            if span.get("backend"):
+                backends = totals.setdefault("backends", {})
+                backends[span["backend"]] = backends.get(span["backend"], 0) + 1
+        if totals["request_wire_bytes"]:
+            totals["compression_ratio"] = round(totals["request_bytes"] / totals["request_wire_bytes"], 2)
+        return {"total_ms": round((time.perf_counter() - self._started) * 1000, 2), "phases": phases, **totals}
 
-# Langflow Message (버전 호환)
-try:
-    from langflow.schema.message import Message  # Langflow >= 1.0
-except Exception:  # pragma: no cover
-    try:
-        from langflow.schema import Message  # 일부 구버전
-    except Exception:  # pragma: no cover
-        Message = None  # type: ignore
+    def finish(self) -> Dict[str, Any]:
+        summary = self.summary()
+        if self._root is not None:
+            self._root.set_attribute("coe.total_ms", summary["total_ms"])
+            self._root.set_attribute("coe.iterations", summary["iterations"])
+            self._root.end()
+            self._root = None
+        return summary
 
-ALLOWED_OWNERS = {"openai", "sktax"}
-DEFAULT_BACKEND = os.getenv("COE_BACKEND_URL", "http://host.docker.internal:8000").strip().rstrip("/")
+    def fail(self, error: BaseException) -> None:
+        """예외로 끝난 실행: root span을 오류 상태로 닫습니다(finish 이후면 무시)."""
+        if self._root is None:
+            return
+        root, self._root = self._root, None
+        summary = self.summary()
+        root.set_attribute("coe.total_ms", summary["total_ms"])
+        root.set_attribute("coe.iterations", summary["iterations"])
+        root.set_attribute("coe.error", type(error).__name__)
+        if isinstance(error, Exception):
+            root.record_exception(error)
+        root.set_status(_otel_trace.Status(_otel_trace.StatusCode.ERROR, str(error) or type(error).__name__))
+        root.end()
+
+
+# 교환 기록: COE_TRACE_RECORD 경로(.gz면 gzip)에 _call_chat 1회당 JSON 1줄을 추가 (benchmarks/trace_replay.py로 재생)
+TRACE_RECORD_PATH = os.getenv("COE_TRACE_RECORD", "").strip()
+
+
+def _trace_record_entry(
+    chat_text: str,
+    prompt: str,
+    model_name: str,
+    tools_payload: List[Dict[str, Any]],
+    payload: Dict[str, Any],
+) -> Dict[str, Any]:
+    """
+    최종 payload의 conversation/trace에서 재생에 필요한 것만 추립니다:
+    턴별 assistant 메시지와 dispatch 지연, 도구 호출별 인자/출력/실행 시간.
+    도구 출력은 conversation의 잘린 사본(clip_tool_output)이 아닌 tool_results의 원본을 씁니다.
+    """
+    conversation = payload.get("conversation") or []
+    start = 0
+    for index, message in enumerate(conversation):
+        if message.get("role") == "user":
+            start = index + 1
+    spans = payload.get("trace") or []
+    dispatch_ms = [span.get("ms") for span in spans if span.get("phase") == "dispatch"]
+    tool_ms: Dict[Tuple[Any, Any], List[Any]] = {}
+    for span in spans:
+        if span.get("phase") == "tool":
+            tool_ms.setdefault((span.get("iteration"), span.get("name")), []).append(span.get("ms"))
+
+    turns: List[Dict[str, Any]] = []
+    outputs = {m.get("tool_call_id"): m.get("content") for m in conversation[start:] if m.get("role") == "tool"}
+    # tool_results는 tool_calls 순서대로 1개씩 쌓이므로 뒤에서부터 맞춰 정렬(앞쪽 턴이 압축으로 빠져도 어긋나지 않음)
+    tool_results = ((payload.get("message") or {}).get("data") or {}).get("tool_results") or []
+    call_count = sum(
+        len(m.get("tool_calls") or []) for m in conversation[start:] if m.get("role") == "assistant"
+    )
+    result_index = len(tool_results) - call_count
+    for message in conversation[start:]:
+        if message.get("role") != "assistant":
+            continue
+        iteration = len(turns) + 1
+        calls = []
+        for call in message.get("tool_calls") or []:
+            name = (call.get("function") or {}).get("name")
+            durations = tool_ms.get((iteration, name)) or [0.0]
+            output = outputs.get(call.get("id"), "")
+            if 0 <= result_index < len(tool_results):
+                output = tool_results[result_index].get("output", output)
+            result_index += 1
+            calls.append(
+                {
+                    "id": call.get("id"),
+                    "name": name,
+                    "arguments": (call.get("function") or {}).get("arguments"),
+                    "output": output,
+                    "ms": durations.pop(0) if len(durations) > 1 else durations[0],
+                }
+            )
+        turns.append(
+            {
+                "message": {k: message[k] for k in ("role", "content", "tool_calls") if k in message},
+                "ms": dispatch_ms[iteration - 1] if iteration <= len(dispatch_ms) else None,
+                "tool_calls": calls,
+            }
+        )
+    return {
+        "v": 1,
+        "ts": round(time.time(), 3),
+        "input": chat_text,
+        "prompt": prompt,
+        "model_name": model_name,
+        "model_id": (payload.get("routing") or {}).get("model_id"),
+        "tools": tools_payload,
+        "turns": turns,
+    }
+
+
+class _TraceRecorder:
+    """기록 파일에 JSON 줄을 스레드 안전하게 추가합니다. .gz 경로는 gzip member 단위로 이어 씁니다."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, entry: Dict[str, Any]) -> None:
+        line = _json_dumps(entry) + b"\n"
+        with self._lock:
+            if self.path.endswith(".gz"):
+                with gzip.open(self.path, "ab") as f:
+                    f.write(line)
+            else:
+                with open(self.path, "ab") as f:
+                    f.write(line)
+
+
+_TRACE_RECORDER: Optional[_TraceRecorder] = _TraceRecorder(TRACE_RECORD_PATH) if TRACE_RECORD_PATH else None
+
+
+class _RateLimiter:
+    """초당 요청 수 제한 (요청 간 최소 간격을 보장하는 단순 페이서)."""
+
+    def __init__(self, rate_per_second: float) -> None:
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def _batch_item_text(item: Any) -> str:
+    """배치 항목(Message / Data / dict 행 / str)에서 프롬프트 텍스트를 꺼냅니다."""
+    if item is None:
+        return ""
+    if isinstance(item, str):
+        return item
+    text = getattr(item, "text", None)
+    if isinstance(text, str) and text:
+        return text
+    data = getattr(item, "data", None)
+    if not isinstance(data, dict) and isinstance(item, dict):
+        data = item
+    if isinstance(data, dict):
+        for key in ("text", "input", "prompt", "question"):
+            if data.get(key):
+                return str(data[key])
+        return _json_dumps_text(data)
+    return str(item)
+
+
+def _expand_batch_items(raw: Any) -> List[Any]:
+    """리스트/단일 값/DataFrame 입력을 항목 리스트로 평탄화합니다."""
+    if raw is None:
+        return []
+    items = raw if isinstance(raw, (list, tuple)) else [raw]
+    expanded: List[Any] = []
+    for item in items:
+        # DataFrame(pandas 기반) → 행 dict
+        if hasattr(item, "to_dict") and hasattr(item, "columns"):
+            try:
+                expanded.extend(item.to_dict(orient="records"))
+                continue
+            except Exception:
+                pass
+        expanded.append(item)
+    return expanded
+
+
+# 세션 메모리: 세션 id별 최근 대화 창(토큰 한도) + 밀려난 턴의 누적 요약
+SESSION_TTL = float(os.getenv("COE_SESSION_TTL", str(24 * 3600)))
+SESSION_MAX_SESSIONS = int(os.getenv("COE_SESSION_MAX_SESSIONS", "1024"))
+SESSION_SNIPPET_CHARS = 200
+
+
+def _new_session_state() -> Dict[str, Any]:
+    return {"summary": [], "turns": [], "revision": 0}
+
+
+def _apply_session_turn(
+    state: Dict[str, Any],
+    user_text: str,
+    assistant_text: str,
+    window_tokens: int,
+    summary_tokens: int,
+) -> Dict[str, Any]:
+    """
+    턴(user/assistant)을 추가한 새 상태를 반환합니다.
+    창이 window_tokens를 넘으면 오래된 턴부터 요약 줄로 밀어내고, 요약은 summary_tokens 이내로 유지합니다.
+    """
+    turns = list(state.get("turns") or [])
+    summary = list(state.get("summary") or [])
+    turns.append({"role": "user", "content": user_text})
+    turns.append({"role": "assistant", "content": assistant_text})
+    while len(turns) > 2 and sum(_message_tokens(m) for m in turns) > max(0, window_tokens):
+        for message in turns[:2]:
+            snippet = " ".join(str(message.get("content") or "").split())[:SESSION_SNIPPET_CHARS]
+            summary.append(f"- {message['role']}: {snippet}")
+        turns = turns[2:]
+    while summary and sum(_estimate_tokens(line) for line in summary) > max(0, summary_tokens):
+        summary.pop(0)
+    return {"summary": summary, "turns": turns, "revision": int(state.get("revision") or 0) + 1}
+
+
+def _session_history(state: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """요청에 재전송할 세션 기록: 요약 1개(있으면) + 최근 턴."""
+    history: List[Dict[str, Any]] = []
+    if state.get("summary"):
+        header = "[session summary] Earlier turns in this conversation:"
+        history.append({"role": "assistant", "content": "\n".join([header] + state["summary"])})
+    history.extend(dict(m) for m in state.get("turns") or [])
+    return history
+
+
+class _SessionStore:
+    """
+    세션 id → 세션 상태 저장소.
+    메모리 LRU(+TTL)를 기본으로, redis:// URL이면 Redis, 그 외 경로면 SQLite 계층에 write-through 합니다.
+    공유 계층이 있으면 여러 워커가 같은 세션을 갱신하므로 조회는 항상 계층에서 읽고(read-through),
+    저장은 조회 시점의 revision이 그대로일 때만 반영합니다(lost update 방지).
+    """
+
+    def __init__(self, location: Optional[str] = None) -> None:
+        self.location = location or None
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._redis: Any = None
+        if self.location and self.location.startswith(("redis://", "rediss://", "unix://")):
+            if _redis is None:
+                raise RuntimeError("redis package is not installed")
+            self._redis = _redis.Redis.from_url(self.location)
+        elif self.location:
+            self._db = sqlite3.connect(self.location, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS coe_session "
+                "(session_id TEXT PRIMARY KEY, expires_at REAL NOT NULL, body TEXT NOT NULL)"
+            )
+            self._db.commit()
+
+    def load(self, session_id: str) -> Dict[str, Any]:
+        now = time.time()
+        if self._redis is None and self._db is None:
+            with self._lock:
+                entry = self._entries.get(session_id)
+                if entry is not None and entry[0] > now:
+                    self._entries.move_to_end(session_id)
+                    return entry[1]
+            return _new_session_state()
+        if self._redis is not None:
+            body = self._redis.get(f"coe:session:{session_id}")
+        else:
+            with self._lock:
+                body = self._read_db(session_id)
+        state = _json_loads(body) if body else _new_session_state()
+        with self._lock:
+            self._put_memory(session_id, state)
+        return state
+
+    def save(self, session_id: str, state: Dict[str, Any], expected_revision: Optional[int] = None) -> bool:
+        """
+        상태를 저장합니다. expected_revision이 주어지면 저장된 revision이 그 값일 때만 반영하고,
+        다른 워커가 먼저 갱신했으면 False를 반환합니다(호출 측이 다시 읽어 재적용).
+        """
+        body = _json_dumps(state)
+        if self._redis is not None:
+            key = f"coe:session:{session_id}"
+            with self._redis.pipeline() as pipe:
+                try:
+                    pipe.watch(key)
+                    if expected_revision is not None and self._revision(pipe.get(key)) != expected_revision:
+                        pipe.unwatch()
+                        return False
+                    pipe.multi()
+                    pipe.set(key, body, ex=max(1, int(SESSION_TTL)))
+                    pipe.execute()
+                except _redis.WatchError:
+                    return False
+            with self._lock:
+                self._put_memory(session_id, state)
+            return True
+        with self._lock:
+            if self._db is not None:
+                # BEGIN IMMEDIATE로 쓰기 잠금을 먼저 잡아 다른 프로세스와의 비교-저장 사이 경합을 막음
+                self._db.execute("BEGIN IMMEDIATE")
+                try:
+                    current = self._revision(self._read_db(session_id))
+                    if expected_revision is not None and current != expected_revision:
+                        self._db.rollback()
+                        return False
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO coe_session (session_id, expires_at, body) VALUES (?, ?, ?)",
+                        (session_id, time.time() + SESSION_TTL, body),
+                    )
+                    self._db.execute("DELETE FROM coe_session WHERE expires_at <= ?", (time.time(),))
+                    self._db.commit()
+                except BaseException:
+                    self._db.rollback()
+                    raise
+            elif expected_revision is not None:
+                entry = self._entries.get(session_id)
+                current = entry[1] if entry is not None and entry[0] > time.time() else None
+                if int((current or {}).get("revision") or 0) != expected_revision:
+                    return False
+            self._put_memory(session_id, state)
+        return True
+
+    def _read_db(self, session_id: str) -> Optional[str]:
+        row = self._db.execute(
+            "SELECT expires_at, body FROM coe_session WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row[1] if row is not None and row[0] > time.time() else None
+
+    @staticmethod
+    def _revision(body: Any) -> int:
+        if not body:
+            return 0
+        try:
+            return int(_json_loads(body).get("revision") or 0)
+        except Exception:
+            return 0
+
+    def clear(self, session_id: str) -> None:
+        with self._lock:
+            self._entries.pop(session_id, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM coe_session WHERE session_id = ?", (session_id,))
+                self._db.commit()
+        if self._redis is not None:
+            self._redis.delete(f"coe:session:{session_id}")
+
+    def _put_memory(self, session_id: str, state: Dict[str, Any]) -> None:
+        self._entries.pop(session_id, None)
+        self._entries[session_id] = (time.time() + SESSION_TTL, state)
+        while len(self._entries) > max(1, SESSION_MAX_SESSIONS):
+            self._entries.popitem(last=False)
+
+
+_SESSION_STORES: Dict[Optional[str], _SessionStore] = {}
+_SESSION_STORES_LOCK = threading.Lock()
+
+
+def _get_session_store(location: Optional[str] = None) -> _SessionStore:
+    location = (location or "").strip() or None
+    with _SESSION_STORES_LOCK:
+        store = _SESSION_STORES.get(location)
+        if store is None:
+            store = _SESSION_STORES[location] = _SessionStore(location)
+        return store
+
+
+# Message data 출력 프로필: full(원본 전체) / lean(요약) / lazy(참조만, 필요 시 materialize_response)
+OUTPUT_PROFILES = ("full", "lean", "lazy")
+LEAN_TOOL_OUTPUT_CHARS = int(os.getenv("COE_LEAN_TOOL_OUTPUT_CHARS", "500"))
+LAZY_PAYLOAD_REFS = int(os.getenv("COE_LAZY_PAYLOAD_REFS", "128"))
+
+
+def _summarize_raw_response(raw: Any) -> Dict[str, Any]:
+    """원본 응답 대신 보관할 식별/사용량 정보만 추립니다."""
+    if not isinstance(raw, dict):
+        return {}
+    choice0 = (raw.get("choices") or [{}])[0] or {}
+    return {
+        "id": raw.get("id"),
+        "model": raw.get("model"),
+        "usage": raw.get("usage"),
+        "finish_reason": choice0.get("finish_reason") if isinstance(choice0, dict) else None,
+    }
+
+
+def _summarize_tool_results(tool_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """도구 출력 본문을 LEAN_TOOL_OUTPUT_CHARS로 자르고 원래 길이를 남깁니다."""
+    summarized: List[Dict[str, Any]] = []
+    for result in tool_results:
+        output = str(result.get("output") or "")
+        entry = dict(result, output=output[:LEAN_TOOL_OUTPUT_CHARS], output_chars=len(output))
+        summarized.append(entry)
+    return summarized
+
+
+class _PayloadRefs:
+    """
+    lazy 프로필에서 Message에 참조만 남긴 응답 payload를 보관하는 LRU (프로세스 전역).
+    best-effort 보관: 재시작/다른 워커/LAZY_PAYLOAD_REFS개 이후의 응답이 들어오면 참조는 풀리지 않습니다(None).
+    같은 payload(한 실행의 여러 출력)에는 같은 ref를 돌려줍니다.
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # id(payload) → ref. 항목이 LRU에 있는 동안 payload가 살아 있으므로 id가 재사용되지 않음
+        self._refs: Dict[int, str] = {}
+
+    def put(self, payload: Dict[str, Any]) -> str:
+        with self._lock:
+            ref = self._refs.get(id(payload))
+            if ref is not None and self._entries.get(ref) is payload:
+                self._entries.move_to_end(ref)
+                return ref
+            ref = uuid.uuid4().hex
+            self._entries[ref] = payload
+            self._refs[id(payload)] = ref
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._refs.pop(id(evicted), None)
+        return ref
+
+    def get(self, ref: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            payload = self._entries.get(ref)
+            if payload is not None:
+                self._entries.move_to_end(ref)
+            return payload
 
 
-def _http_get_json(url: str, timeout: float = 8.0) -> Dict[str, Any]:
-    req = urlreq.Request(url, headers={"User-Agent": "langflow"})
-    with urlreq.urlopen(req, timeout=timeout) as r:
-        return json.loads(r.read().decode("utf-8"))
+_PAYLOAD_REFS = _PayloadRefs(LAZY_PAYLOAD_REFS)
 
 
-def _http_post_json(url: str, payload: Dict[str, Any], timeout: float = 30.0) -> Dict[str, Any]:
-    data = json.dumps(payload).encode("utf-8")
-    req = urlreq.Request(url, data=data, headers={"Content-Type": "application/json", "User-Agent": "langflow"})
-    with urlreq.urlopen(req, timeout=timeout) as r:
-        return json.loads(r.read().decode("utf-8"))
+def materialize_response(ref: str) -> Optional[Dict[str, Any]]:
+    """
+    lazy 프로필 Message의 data["response_ref"]로 전체 응답 payload(raw/conversation/tool_results)를 조회.
+    같은 프로세스에 아직 보관 중일 때만 돌려주고, 그 외에는 None입니다.
+    """
+    return _PAYLOAD_REFS.get(ref)
+
+
+# 자동 모델 선택 (지연/오류율 기반 라우팅)
+AUTO_MODEL_OPTION = "Auto (latency-aware)"
+AUTO_MODEL_KEY = "auto"
+MODEL_EWMA_ALPHA = float(os.getenv("COE_MODEL_EWMA_ALPHA", "0.3"))
+MODEL_MAX_ERROR_RATE = float(os.getenv("COE_MODEL_MAX_ERROR_RATE", "0.5"))
+MODEL_DEGRADED_COOLDOWN = float(os.getenv("COE_MODEL_DEGRADED_COOLDOWN", "60"))
+
+
+class _ModelRouter:
+    """
+    모델 id별 dispatch 지연/오류율 EWMA를 유지하고, 후보 중 가장 빠른 건강한 모델을 고릅니다.
+    오류율이 임계값을 넘은 모델은 cooldown 동안 제외되었다가 이후 다시 탐색됩니다.
+    """
+
+    def __init__(self, alpha: float = MODEL_EWMA_ALPHA) -> None:
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def record(self, model_id: str, seconds: float, ok: bool) -> None:
+        if not model_id:
+            return
+        with self._lock:
+            stat = self._stats.get(model_id)
+            if stat is None:
+                stat = self._stats[model_id] = {"latency": seconds, "error_rate": 0.0 if ok else 1.0, "samples": 0}
+            else:
+                if ok:
+                    stat["latency"] += self.alpha * (seconds - stat["latency"])
+                stat["error_rate"] += self.alpha * ((0.0 if ok else 1.0) - stat["error_rate"])
+            stat["samples"] += 1
+            if not ok:
+                stat["last_failure"] = time.monotonic()
+
+    def _healthy(self, stat: Optional[Dict[str, float]], now: float) -> bool:
+        if stat is None or stat["error_rate"] <= MODEL_MAX_ERROR_RATE:
+            return True
+        return now - stat.get("last_failure", 0.0) >= MODEL_DEGRADED_COOLDOWN
+
+    def choose(self, candidates: List[str]) -> str:
+        """후보 순서를 tie-break로 사용. 관측치가 없는 모델은 먼저 탐색합니다."""
+        if not candidates:
+            return ""
+        now = time.monotonic()
+        with self._lock:
+            stats = {c: dict(self._stats[c]) if c in self._stats else None for c in candidates}
+        healthy = [c for c in candidates if self._healthy(stats[c], now)]
+        if not healthy:
+            return min(candidates, key=lambda c: (stats[c] or {}).get("error_rate", 0.0))
+        unexplored = [c for c in healthy if stats[c] is None]
+        if unexplored:
+            return unexplored[0]
+        return min(healthy, key=lambda c: stats[c]["latency"])
+
+    def estimates(self, model_ids: Optional[List[str]] = None) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            keys = model_ids if model_ids is not None else list(self._stats)
+            return {
+                k: {
+                    "latency_ms": round(self._stats[k]["latency"] * 1000, 2),
+                    "error_rate": round(self._stats[k]["error_rate"], 4),
+                    "samples": int(self._stats[k]["samples"]),
+                }
+                for k in keys
+                if k in self._stats
+            }
+
+
+_MODEL_ROUTER = _ModelRouter()
+
+
+def _is_valid_chat_response(resp: Any) -> bool:
+    """choices[0].message에 본문 또는 tool_calls가 있는 완결된 응답인지 확인."""
+    if not isinstance(resp, dict):
+        return False
+    choices = resp.get("choices") or []
+    message = (choices[0] or {}).get("message") if choices and isinstance(choices[0], dict) else None
+    return isinstance(message, dict) and bool(message.get("content") or message.get("tool_calls"))
+
+
+class _RaceWins:
+    """레이스 모드에서 모델별 승리 횟수(프로세스 전역)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._wins: Dict[str, int] = {}
+
+    def record(self, model_id: str) -> None:
+        with self._lock:
+            self._wins[model_id] = self._wins.get(model_id, 0) + 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._wins)
+
+
+_RACE_WINS = _RaceWins()
+
+
+def model_routing_stats() -> Dict[str, Dict[str, float]]:
+    """모델 id별 EWMA 지연(ms)/오류율/표본 수와 레이스 승리 횟수."""
+    stats = _MODEL_ROUTER.estimates()
+    for model_id, wins in _RACE_WINS.snapshot().items():
+        stats.setdefault(model_id, {})["race_wins"] = wins
+    return stats
 
 
 class CoEModelPicker(Component):
@@ -68,11 +2264,8 @@ class CoEModelPicker(Component):
     category = "agents"
     priority = 0
 
-    # name -> id 매핑(런타임에 채움)
+    # name -> id 매핑(런타임에 채움, 인스턴스별). 백엔드 URL별 목록은 _MODEL_CATALOG가 공유
     _name_to_id: Dict[str, str] = {}
-    # 최근 호출 결과 캐시
-    _last_response: Optional[Dict[str, Any]] = None
-    _last_request_signature: Optional[Tuple[Any, ...]] = None
 
     # ★ 첫 렌더링(마운트) 시 자동 로드 제어 플래그
     _did_initial_fetch: bool = False
@@ -107,10 +2300,19 @@ class CoEModelPicker(Component):
             name="backend_url",
             display_name="CoE Backend URL",
             value=DEFAULT_BACKEND,
-            info="mac/Windows: http://greatcoe.cafe24.com",
+            info="mac/Windows: http://greatcoe.cafe24.com. Several backends (comma/newline separated) are load-balanced.",
             advanced=True,
             real_time_refresh=True,
         ),
+        DropdownInput(
+            name="balance_policy",
+            display_name="Backend Balancing",
+            options=list(BALANCE_POLICIES),
+            value="least_outstanding",
+            info="How requests are spread when several backends are configured: fewest in-flight requests, "
+            "or power-of-two-choices.",
+            advanced=True,
+        ),
         BoolInput(
             name="force_https",
             display_name="Force HTTPS",
@@ -118,6 +2320,47 @@ class CoEModelPicker(Component):
             advanced=True,
             real_time_refresh=True,
         ),
+        BoolInput(
+            name="stream",
+            display_name="Stream Responses",
+            value=False,
+            info="Request stream=true and push partial text to the Chat Output message as it arrives.",
+            advanced=True,
+        ),
+        BoolInput(
+            name="http2",
+            display_name="HTTP/2",
+            value=HTTP2_DEFAULT,
+            info="Use HTTP/2 on pooled backend connections (requires the h2 package).",
+            advanced=True,
+        ),
+        DropdownInput(
+            name="output_profile",
+            display_name="Output Profile",
+            options=list(OUTPUT_PROFILES),
+            value="full",
+            info="full: keep raw response and tool outputs in Message data. lean: keep summaries only. "
+            "lazy: keep a response_ref that can be materialized on demand; best-effort and process-local "
+            "(refs do not survive a restart, other workers, or eviction after COE_LAZY_PAYLOAD_REFS newer responses).",
+            advanced=True,
+        ),
+        DropdownInput(
+            name="request_compression",
+            display_name="Request Compression",
+            options=list(REQUEST_COMPRESSION_MODES),
+            value="off",
+            info="Compress large request bodies (Content-Encoding). auto prefers zstd when installed, then gzip; "
+            "an encoding rejected with 415 (or a 400/413/422 that an uncompressed resend fixes) is disabled for that "
+            "backend. Compressed responses are always accepted.",
+            advanced=True,
+        ),
+        IntInput(
+            name="compression_min_bytes",
+            display_name="Compression Threshold (bytes)",
+            value=COMPRESSION_MIN_BYTES,
+            info="Request bodies smaller than this are sent uncompressed.",
+            advanced=True,
+        ),
         BoolInput(
             name="refresh_now",
             display_name="Refresh models now",
@@ -150,6 +2393,213 @@ class CoEModelPicker(Component):
             advanced=True,
             real_time_refresh=False,
         ),
+        FloatInput(
+            name="response_cache_ttl",
+            display_name="Response Cache TTL (s)",
+            value=0.0,
+            info="Reuse the response of an identical request for this many seconds. 0 disables the cache. "
+            "Responses that used tools are only cached when every tool is cacheable (see Cacheable Tools).",
+            advanced=True,
+        ),
+        IntInput(
+            name="response_cache_size",
+            display_name="Response Cache Size",
+            value=256,
+            info="Maximum number of cached responses kept in memory (LRU).",
+            advanced=True,
+        ),
+        StrInput(
+            name="auto_model_tier",
+            display_name="Auto Model Tier",
+            value="",
+            info=f"Comma-separated model names or ids eligible for '{AUTO_MODEL_OPTION}'. Empty = all chat models.",
+            advanced=True,
+        ),
+        StrInput(
+            name="race_models",
+            display_name="Race Models",
+            value="",
+            info="Comma-separated model names or ids. When two or more are set, the first turn is sent to all of them "
+            "and the first complete response wins; the rest are cancelled. Empty = disabled.",
+            advanced=True,
+        ),
+        StrInput(
+            name="response_cache_path",
+            display_name="Response Cache SQLite Path",
+            value="",
+            info="Optional SQLite file used as a shared on-disk cache tier.",
+            advanced=True,
+        ),
+        IntInput(
+            name="max_retries",
+            display_name="Max Retries",
+            value=2,
+            info="Retries per backend call for retryable status codes and connection errors (jittered backoff).",
+            advanced=True,
+        ),
+        StrInput(
+            name="retry_statuses",
+            display_name="Retry Status Codes",
+            value="429,502,503,504",
+            info="Comma-separated codes, ranges or classes to retry, e.g. 429,500-504 or 5xx. Retry-After is honored.",
+            advanced=True,
+        ),
+        FloatInput(
+            name="retry_backoff_base",
+            display_name="Retry Backoff Base (s)",
+            value=0.5,
+            info="Base delay for exponential backoff with full jitter when Retry-After is absent.",
+            advanced=True,
+        ),
+        BoolInput(
+            name="hedge_requests",
+            display_name="Hedge Slow Requests",
+            value=False,
+            info="Start a duplicate backend request after the recent p95 latency and keep whichever finishes first (not used with streaming).",
+            advanced=True,
+        ),
+        BoolInput(
+            name="session_memory",
+            display_name="Session Memory",
+            value=False,
+            info="Keep per-session conversation memory: recent turns within a token window plus a rolling summary "
+            "are resent before the current input.",
+            advanced=True,
+        ),
+        StrInput(
+            name="session_id",
+            display_name="Session ID",
+            value="",
+            info="Session key for memory. Empty = the chat input's / flow run's session id.",
+            advanced=True,
+        ),
+        StrInput(
+            name="session_store",
+            display_name="Session Store",
+            value="",
+            info="Empty = in-process only. redis://... = Redis; any other value = SQLite file path.",
+            advanced=True,
+        ),
+        IntInput(
+            name="session_window_tokens",
+            display_name="Session Window Tokens",
+            value=4000,
+            info="Approximate token budget for verbatim recent turns; older turns move into the summary.",
+            advanced=True,
+        ),
+        IntInput(
+            name="session_summary_tokens",
+            display_name="Session Summary Tokens",
+            value=600,
+            info="Approximate token cap for the rolling summary of older turns.",
+            advanced=True,
+        ),
+        FloatInput(
+            name="request_deadline",
+            display_name="Request Deadline (s)",
+            value=0,
+            info="End-to-end time budget for the whole tool loop. Backend calls and tools only get the remaining "
+            "time; on expiry the best partial answer is returned with a timeout marker. 0 = no deadline.",
+            advanced=True,
+        ),
+        IntInput(
+            name="context_token_budget",
+            display_name="Context Token Budget",
+            value=0,
+            info="Approximate token budget for messages re-sent in the tool loop. Older tool turns are compacted above it. "
+            "0 disables (default).",
+            advanced=True,
+        ),
+        IntInput(
+            name="max_tool_output_tokens",
+            display_name="Max Tool Output Tokens",
+            value=0,
+            info="Tool outputs larger than this (approximate tokens; each non-ASCII character counts as one) are "
+            "truncated before being sent back. 0 disables (default).",
+            advanced=True,
+        ),
+        IntInput(
+            name="max_parallel_tools",
+            display_name="Max Parallel Tool Calls",
+            value=4,
+            info="How many tool calls from one model turn may run concurrently.",
+            advanced=True,
+        ),
+        FloatInput(
+            name="tool_timeout",
+            display_name="Tool Timeout (s)",
+            value=120.0,
+            info="Per tool call timeout in seconds. 0 disables the timeout.",
+            advanced=True,
+        ),
+        IntInput(
+            name="tool_thread_workers",
+            display_name="Tool Thread Workers",
+            value=8,
+            info="Thread pool size used to run tools that have no async implementation.",
+            advanced=True,
+        ),
+        IntInput(
+            name="tool_concurrency_limit",
+            display_name="Per-Tool Concurrency Limit",
+            value=0,
+            info="Maximum concurrent executions of the same tool across flows in this worker. 0 = unlimited.",
+            advanced=True,
+        ),
+        StrInput(
+            name="cpu_bound_tools",
+            display_name="CPU-bound Tools",
+            value="",
+            info="Comma-separated tool names to run in a process pool (tools must be picklable).",
+            advanced=True,
+        ),
+
+        StrInput(
+            name="cacheable_tools",
+            display_name="Cacheable Tools",
+            value="",
+            info="Comma-separated names of deterministic tools whose results may be reused for identical arguments "
+            "(* = all). Tools can also opt in with metadata {'cacheable': True, 'cache_ttl': seconds}.",
+            advanced=True,
+        ),
+        FloatInput(
+            name="tool_cache_ttl",
+            display_name="Tool Result Cache TTL (s)",
+            value=300,
+            info="Default lifetime of cached tool results.",
+            advanced=True,
+        ),
+        IntInput(
+            name="tool_cache_size",
+            display_name="Tool Result Cache Size",
+            value=512,
+            info="Maximum number of cached tool results kept in this process.",
+            advanced=True,
+        ),
+
+        # ── 배치 모드
+        HandleInput(
+            name="batch_inputs",
+            display_name="Batch Inputs",
+            input_types=["Message", "Data", "DataFrame"],
+            is_list=True,
+            required=False,
+            info="List of messages, texts or rows. Each item is sent as its own chat request (Batch Results output).",
+        ),
+        IntInput(
+            name="batch_concurrency",
+            display_name="Batch Concurrency",
+            value=8,
+            info="Maximum number of batch items processed concurrently.",
+            advanced=True,
+        ),
+        FloatInput(
+            name="batch_rate_limit",
+            display_name="Batch Rate Limit (req/s)",
+            value=0.0,
+            info="Maximum batch items started per second. 0 = unlimited.",
+            advanced=True,
+        ),
     ]
 
     # ─────────────────────────────────────────────────────────────────────────
@@ -176,6 +2626,13 @@ class CoEModelPicker(Component):
             types=["Message", "Any"],
             selected="Message",
         ),
+        Output(
+            display_name="Batch Results",
+            name="batch_output",
+            method="run_batch",
+            types=["Data", "Any"],
+            selected="Data",
+        ),
         Output(
             display_name="Model ID",
             name="model_id",
@@ -189,11 +2646,23 @@ class CoEModelPicker(Component):
     # 내부 유틸
     @staticmethod
     def _normalize(base: str, force_https: bool) -> str:
-        base = (base or DEFAULT_BACKEND).strip()
+        # 여러 백엔드가 주어지면 첫 번째가 모델 카탈로그/캐시 키 기준
+        parts = (base or "").replace(",", " ").split()
+        base = parts[0] if parts else DEFAULT_BACKEND
         if force_https and base.startswith("http://"):
             base = "https://" + base[len("http://") :]
         return base.rstrip("/")
 
+    @classmethod
+    def _backend_list(cls, backend_url: str, force_https: bool) -> List[str]:
+        """backend_url(쉼표/공백/줄바꿈 구분)의 정규화된 백엔드 목록 (중복 제거, 순서 유지)."""
+        backends: List[str] = []
+        for part in (backend_url or "").replace(",", " ").split() or [DEFAULT_BACKEND]:
+            base = cls._normalize(part, force_https)
+            if base not in backends:
+                backends.append(base)
+        return backends
+
     @staticmethod
     def _linux_fallback(base: str) -> str:
         return base.replace("host.docker.internal", "172.17.0.1") if "host.docker.internal" in base else base
@@ -207,19 +2676,45 @@ class CoEModelPicker(Component):
             ("AX4 Model", "ax4"),
         ]
 
-    def _fetch_models(self, base_url: str) -> List[Tuple[str, str]]:
-        """서버에서 모델 목록을 받아 (name, id)로 반환(필터 적용)"""
-        url = base_url + "/v1/models"
+    def _fetch_models(
+        self, base_url: str, deadline: Optional[float] = None, backends: Optional[List[str]] = None
+    ) -> List[Tuple[str, str]]:
+        """
+        서버에서 모델 목록을 받아 (name, id)로 반환(필터 적용). deadline(time.monotonic 기준)까지만 시도.
+        backends는 base_url 실패 시 시도할 같은 풀의 백엔드 목록입니다(호출 측이 요청 기준 값으로 전달).
+        """
+        http2 = bool(getattr(self, "http2", HTTP2_DEFAULT))
 
         def _try(u: str) -> Dict[str, Any]:
-            return _http_get_json(u, timeout=8.0)
+            timeout = 8.0 if deadline is None else max(0.001, min(8.0, deadline - time.monotonic()))
+            return _http_get_json(u, timeout=timeout, http2=http2)
 
-        try:
-            payload = _try(url)
-        except (URLError, OSError, socket.gaierror):
-            fb = self._linux_fallback(base_url) + "/v1/models"
-            self.log(f"[CoEModelPicker] retry: {fb}")
-            payload = _try(fb)
+        payload: Dict[str, Any] = {}
+        last_error: Optional[BaseException] = None
+        # 기본 백엔드가 실패하면 같은 풀의 다른 백엔드에서 목록을 받음 (카탈로그는 백엔드 간 동일 가정)
+        backends = [base_url] + [b for b in backends or [] if b != base_url]
+        attempts = [
+            (backend, endpoint)
+            for backend in backends
+            for endpoint in _ENDPOINTS.candidates([backend, self._linux_fallback(backend)])
+        ]
+        for i, (backend, endpoint) in enumerate(attempts):
+            if deadline is not None and time.monotonic() >= deadline:
+                last_error = last_error or TimeoutError("request deadline exceeded before model list fetch")
+                break
+            if i:
+                self.log(f"[CoEModelPicker] retry: {endpoint}/v1/models")
+            try:
+                payload = _try(endpoint + "/v1/models")
+            except _HTTP_ERRORS as e:
+                _ENDPOINTS.record_failure(backend, endpoint, e)
+                last_error = e
+                continue
+            _ENDPOINTS.record_success(backend, endpoint)
+            last_error = None
+            break
+        if last_error is not None:
+            raise last_error
 
         data = (payload.get("result") or {}).get("data") or payload.get("data") or []
         pairs: List[Tuple[str, str]] = []
@@ -261,7 +2756,12 @@ class CoEModelPicker(Component):
 
         if should_refresh:
             try:
-                pairs = self._fetch_models(base)
+                # 캐시가 있으면 즉시 반환(만료 시 백그라운드 갱신), 수동 새로고침만 강제 조회
+                # 편집 중인 backend_url 기준 목록 (인스턴스 속성은 아직 이전 값일 수 있음)
+                backends = self._backend_list(current_base, current_force_https)
+                pairs, status = _MODEL_CATALOG.get(
+                    base, lambda b: self._fetch_models(b, backends=backends), force=field_name == "refresh_now"
+                )
                 if pairs:
                     self._name_to_id = {name: mid for name, mid in pairs}
                     names = list(self._name_to_id.keys())
@@ -269,7 +2769,7 @@ class CoEModelPicker(Component):
                     if not current_value or current_value not in names:
                         build_config["model_name"]["value"] = names[0]
                     self._did_initial_fetch = True  # ★ 한 번 성공하면 플래그 켜기
-                    self.log(f"[CoEModelPicker] models loaded: {len(names)} from {base}")
+                    self.log(f"[CoEModelPicker] models loaded: {len(names)} from {base} ({status})")
                 else:
                     # 서버 응답이 비었을 때 폴백
                     pairs = self._fallback_pairs()
@@ -291,6 +2791,12 @@ class CoEModelPicker(Component):
                 self._did_initial_fetch = True
                 self.log(f"[CoEModelPicker] fetch failed: {e}; using fallback list")
 
+            # 자동 선택 옵션은 항상 목록 맨 앞에 유지
+            options = [o for o in build_config["model_name"].get("options") or [] if o != AUTO_MODEL_OPTION]
+            build_config["model_name"]["options"] = [AUTO_MODEL_OPTION] + options
+            if current_value == AUTO_MODEL_OPTION:
+                build_config["model_name"]["value"] = AUTO_MODEL_OPTION
+
             # ★ 수동 토글이 켜져 있으면 끄면서(체크 해제) UI 깜빡임 방지
             if "refresh_now" in build_config:
                 build_config["refresh_now"]["value"] = False
@@ -328,69 +2834,58 @@ class CoEModelPicker(Component):
         """
         Langflow에서 선택된 self.tools를 StructuredTool로 빌드한 뒤
         OpenAI Tool Calling 포맷으로 직렬화하여 반환합니다.
+        연결된 도구 구성이 직전과 같으면 toolkit 빌드와 스키마 생성을 건너뜁니다.
         """
-        structured_tools: List[Any] = []
-
+        input_tools: List[Any] = []
         if isinstance(getattr(self, "tools", None), list) and self.tools:
-            structured_tools.extend(self.tools)
+            input_tools.extend(self.tools)
+
+        tool_description = self.get_tool_description() if hasattr(self, "get_tool_description") else ""
+        fingerprints = [_tool_fingerprint(t) for t in input_tools]
+        cache_key = (tuple((id(t), fp) for t, fp in zip(input_tools, fingerprints)), tool_description)
+        cached = getattr(self, "_tools_payload_cache", None)
+        if cached is not None and cached[0] == cache_key:
+            return list(cached[1]), dict(cached[2])
+
+        structured_tools: List[Tuple[Any, Optional[Tuple[Any, ...]]]] = list(zip(input_tools, fingerprints))
 
         toolkit_builder = _get_component_toolkit()
         toolkit = toolkit_builder(component=self)
+        fetched_tools: List[Any] = []
         try:
             fetched_tools = toolkit.get_tools(
                 tool_name="Call_Agent",
-                tool_description=self.get_tool_description() if hasattr(self, "get_tool_description") else "",
+                tool_description=tool_description,
                 callbacks=None,
-            )
-            structured_tools.extend(fetched_tools or [])
+            ) or []
         except Exception as e:
             if "there must be only one tool" in str(e).lower():
                 try:
-                    structured_tools.extend(toolkit.get_tools(callbacks=None) or [])
+                    fetched_tools = toolkit.get_tools(callbacks=None) or []
                 except Exception as inner_e:
                     self.log(f"[CoEModelPicker] tool toolkit fallback failed: {inner_e}")
             else:
                 self.log(f"[CoEModelPicker] tool toolkit build failed: {e}")
-
-        if not structured_tools:
-            return [], {}
+        structured_tools.extend((t, None) for t in fetched_tools)
 
         seen_names: Dict[str, bool] = {}
         tools_payload: List[Dict[str, Any]] = []
         tool_map: Dict[str, Any] = {}
-        for t in structured_tools:
+        for t, fingerprint in structured_tools:
             try:
                 name = getattr(t, "name", None) or ""
-                description = getattr(t, "description", "") or ""
-                # args_schema -> JSON Schema
-                schema = {}
-                args_schema = getattr(t, "args_schema", None)
-                if args_schema is not None:
-                    try:
-                        schema = args_schema.schema()
-                    except Exception:
-                        schema = {"type": "object", "properties": {}}
-                else:
-                    schema = {"type": "object", "properties": {}}
-
                 if name and not seen_names.get(name):
-                    tools_payload.append(
-                        {
-                            "type": "function",
-                            "function": {
-                                "name": name,
-                                "description": description,
-                                "parameters": schema,
-                            },
-                        }
-                    )
+                    tools_payload.append(_serialize_tool(t, fingerprint))
                     seen_names[name] = True
                     tool_map[name] = t
             except Exception as e:
                 self.log(f"[CoEModelPicker] tool serialize failed: {e}")
                 continue
 
-        return tools_payload, tool_map
+        # 연결 순서와 무관하게 이름순으로 고정 (prefix 캐시 적중용)
+        tools_payload.sort(key=lambda entry: entry["function"]["name"])
+        self._tools_payload_cache = (cache_key, tools_payload, tool_map)
+        return list(tools_payload), dict(tool_map)
 
     def _build_request_signature(
         self,
@@ -402,12 +2897,13 @@ class CoEModelPicker(Component):
         enable_tools: bool,
         tool_choice_auto: bool,
     ) -> Tuple[Any, ...]:
-        tool_names: Tuple[str, ...] = ()
+        # 도구 이름만이 아니라 정의(설명/스키마) 지문까지 포함: 정의가 바뀐 도구의 응답을 재사용하지 않음
+        tool_names: Tuple[Tuple[str, str], ...] = ()
         try:
             if isinstance(self.tools, list):
                 tool_names = tuple(
                     sorted(
-                        str(getattr(tool, "name", "") or "")
+                        (str(getattr(tool, "name", "") or ""), _tool_definition_digest(tool))
                         for tool in self.tools
                         if getattr(tool, "name", None)
                     )
@@ -436,53 +2932,352 @@ class CoEModelPicker(Component):
         force_https: bool,
         enable_tools: bool,
         tool_choice_auto: bool,
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+        history: Optional[List[Dict[str, Any]]] = None,
+        deadline: Optional[float] = None,
     ) -> Dict[str, Any]:
-        if self._last_response is not None:
-            return self._last_response
-
-        model_id = self._name_to_id.get(model_name or "", "")
-        if not model_id:
-            fpairs = self._fallback_pairs()
-            if fpairs:
-                model_id = fpairs[0][1]
+        # 예외/취소로 끝난 실행도 root span이 오류 상태로 닫히도록 감쌈 (정상 종료는 finish()에서 닫힘)
+        trace = _Trace()
+        try:
+            return await self._chat_loop(
+                trace,
+                chat_input,
+                prompt,
+                model_name,
+                backend_url,
+                force_https,
+                enable_tools,
+                tool_choice_auto,
+                on_delta=on_delta,
+                history=history,
+                deadline=deadline,
+            )
+        except BaseException as e:
+            trace.fail(e)
+            raise
 
+    async def _chat_loop(
+        self,
+        trace: _Trace,
+        chat_input: str,
+        prompt: str,
+        model_name: str,
+        backend_url: str,
+        force_https: bool,
+        enable_tools: bool,
+        tool_choice_auto: bool,
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+        history: Optional[List[Dict[str, Any]]] = None,
+        deadline: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        # 요청 전체 deadline(모델 조회/도구 준비 포함): 각 백엔드 호출/도구 실행은 남은 시간만 사용.
+        # _get_response가 넘긴 deadline이 있으면 그 시작 시각 기준
+        deadline_s = float(getattr(self, "request_deadline", 0) or 0)
+        if deadline is None and deadline_s > 0:
+            deadline = time.monotonic() + deadline_s
         base = self._normalize(backend_url or DEFAULT_BACKEND, bool(force_https))
-        url = base + "/v1/chat/completions"
-        fb = self._linux_fallback(base)
-        fallback_url = fb + "/v1/chat/completions" if base != fb else None
+        with trace.span("model_fetch"):
+            model_id = await self._resolve_model_id(
+                model_name, base, deadline, self._backend_list(backend_url, bool(force_https))
+            )
+        backend_groups = {b: [b, self._linux_fallback(b)] for b in self._backend_list(backend_url, bool(force_https))}
+        balance_policy = str(getattr(self, "balance_policy", "least_outstanding") or "least_outstanding")
+        served_by = {"url": base + "/v1/chat/completions"}
 
         conversation: List[Dict[str, Any]] = []
         if prompt:
             conversation.append({"role": "system", "content": str(prompt)})
+        # 세션 기록(요약 + 최근 턴)은 system 뒤, 현재 질문 앞에 고정
+        conversation.extend(history or [])
         conversation.append({"role": "user", "content": str(chat_input or "")})
+        pinned = len(conversation)
 
         tools_payload: List[Dict[str, Any]] = []
         tool_map: Dict[str, Any] = {}
         if enable_tools:
-            tools_payload, tool_map = self._build_tools_payload()
+            with trace.span("toolkit_build") as attrs:
+                tools_payload, tool_map = self._build_tools_payload()
+                attrs["tools"] = len(tools_payload)
 
         tool_results: List[Dict[str, Any]] = []
         last_response: Optional[Dict[str, Any]] = None
 
-        async def _dispatch(payload: Dict[str, Any]) -> Dict[str, Any]:
+        http2 = bool(getattr(self, "http2", HTTP2_DEFAULT))
+        use_stream = bool(getattr(self, "stream", False)) and httpx is not None
+
+        stream_parts: List[str] = []
+
+        def _http_timeout() -> float:
+            if deadline is None:
+                return 30.0
+            return max(0.001, min(30.0, deadline - time.monotonic()))
+
+        async def _on_delta_tracked(text_delta: str) -> None:
+            # deadline 초과 시 부분 응답으로 쓰기 위해 현재 턴의 스트리밍 텍스트를 보관
+            stream_parts.append(text_delta)
+            if on_delta is not None:
+                await on_delta(text_delta)
+
+        compression = {
+            "compression": str(getattr(self, "request_compression", "off") or "off").lower(),
+            "min_compress_bytes": int(getattr(self, "compression_min_bytes", COMPRESSION_MIN_BYTES) or 0),
+        }
+
+        async def _send(
+            target: str, payload: Dict[str, Any], meter: Dict[str, Any], stream: bool = True
+        ) -> Dict[str, Any]:
+            if not (use_stream and stream):
+                return await _ahttp_post_json(
+                    target, payload, _http_timeout(), http2=http2, meter=meter, **compression
+                )
+            stream_parts.clear()
+            try:
+                return await _astream_chat_completion(
+                    target,
+                    dict(payload, stream=True),
+                    _http_timeout(),
+                    http2=http2,
+                    on_delta=_on_delta_tracked if deadline is not None else on_delta,
+                    meter=meter,
+                    **compression,
+                )
+            except httpx.HTTPStatusError as e:
+                # 스트리밍을 지원하지 않는 백엔드 → 버퍼링 호출로 폴백
+                if e.response.status_code not in {400, 404, 415, 422, 501}:
+                    raise
+                self.log(f"[CoEModelPicker] streaming rejected ({e.response.status_code}); using buffered call")
+                meter["retries"] = meter.get("retries", 0) + 1
+                return await _ahttp_post_json(
+                    target, payload, _http_timeout(), http2=http2, meter=meter, **compression
+                )
+
+        async def _attempt(
+            payload: Dict[str, Any], meter: Dict[str, Any], stream: bool = True, failover: bool = True
+        ) -> Dict[str, Any]:
+            # 분산 정책으로 고른 백엔드부터, 각 백엔드 안에서는 마지막으로 성공한 엔드포인트부터 시도
+            # (연결 수준 오류만 다음 후보로 넘어감). failover=False면 최우선 후보 1곳에만 보냄
+            last_error: Optional[BaseException] = None
+            attempts = [
+                (backend, endpoint)
+                for backend in _BACKENDS.order(backend_groups, balance_policy)
+                for endpoint in _ENDPOINTS.candidates(backend_groups[backend])
+            ]
+            if not failover:
+                attempts = attempts[:1]
+            for attempt, (backend, endpoint) in enumerate(attempts):
+                meter["endpoint"] = endpoint
+                if len(backend_groups) > 1:
+                    meter["backend"] = backend
+                    meter["balance_policy"] = balance_policy
+                if attempt:
+                    meter["retries"] = meter.get("retries", 0) + 1
+                outstanding = _BACKENDS.acquire(backend)
+                if len(backend_groups) > 1:
+                    meter["backend_outstanding"] = outstanding
+                started = time.perf_counter()
+                try:
+                    resp = await _send(endpoint + "/v1/chat/completions", payload, meter, stream)
+                except _HTTP_ERRORS as e:
+                    _BACKENDS.release(backend, time.perf_counter() - started, ok=False)
+                    _ENDPOINTS.record_failure(backend, endpoint, e)
+                    if _is_status_error(e):
+                        # 백엔드가 응답한 상태 오류는 다른 백엔드/엔드포인트로 넘기지 않고 재시도 정책에 맡김
+                        raise
+                    last_error = e
+                    continue
+                except asyncio.CancelledError:
+                    # 헤징/레이스에서 진 요청, deadline 등으로 취소된 요청은 백엔드 실패가 아님
+                    _BACKENDS.release(backend, time.perf_counter() - started, ok=None)
+                    raise
+                except BaseException:
+                    _BACKENDS.release(backend, time.perf_counter() - started, ok=False)
+                    raise
+                _BACKENDS.release(backend, time.perf_counter() - started, ok=True)
+                _ENDPOINTS.record_success(backend, endpoint)
+                served_by["url"] = endpoint + "/v1/chat/completions"
+                return resp
+            raise last_error or RuntimeError(f"no reachable endpoint for {base}")
+
+        retry_policy = self._retry_policy()
+        # 스트리밍은 delta가 중복 전송되므로 헤징하지 않음
+        hedge = bool(getattr(self, "hedge_requests", False)) and not use_stream
+
+        async def _dispatch(payload: Dict[str, Any], iteration: int, racing: bool = False) -> Dict[str, Any]:
+            # 레이스 참가 요청은 delta가 섞이지 않도록 버퍼링 호출로, 헤징 없이 보냄
+            stream = use_stream and not racing
+            with trace.span("dispatch", iteration=iteration, stream=stream, model=payload.get("model")) as meter:
+                retries_done = 0
+                while True:
+                    started = time.perf_counter()
+                    # 재시도 1회 = 백엔드 호출 1회: 엔드포인트/백엔드 순회는 첫 시도에서만 하고,
+                    # 재시도는 분산 정책이 고른 최우선 후보 1곳에만 보냄(과부하 시 요청 증폭 방지)
+                    failover = retries_done == 0
+                    try:
+                        if hedge and not racing:
+                            resp, hedge_won = await _hedged_call(
+                                lambda: _attempt(payload, meter, failover=failover), self._hedge_delay(base)
+                            )
+                            meter["hedge_won"] = hedge_won
+                        else:
+                            resp = await _attempt(payload, meter, stream, failover)
+                    except _HTTP_ERRORS as e:
+                        if not retry_policy.should_retry(e, retries_done):
+                            raise
+                        wait = retry_policy.delay(e, retries_done)
+                        retries_done += 1
+                        meter["retries"] = meter.get("retries", 0) + 1
+                        self.log(
+                            f"[CoEModelPicker] dispatch failed ({_error_status(e) or type(e).__name__}); "
+                            f"retry {retries_done}/{retry_policy.max_retries} in {wait:.2f}s"
+                        )
+                        await asyncio.sleep(wait)
+                        continue
+                    _DISPATCH_LATENCY.record(base, time.perf_counter() - started)
+                    return resp
+
+        auto_route = model_name == AUTO_MODEL_OPTION
+        routing: Dict[str, Any] = {"mode": "auto" if auto_route else "manual", "model_id": model_id, "fallbacks": 0}
+
+        async def _dispatch_routed(payload: Dict[str, Any], iteration: int) -> Dict[str, Any]:
+            """모델별 지연/오류를 라우터에 기록하고, 자동 선택이면 실패 시 다음 후보 모델로 전환합니다."""
+            tried: List[str] = []
+            while True:
+                current = str(payload.get("model") or "")
+                started = time.perf_counter()
+                try:
+                    resp = await _dispatch(payload, iteration)
+                except _HTTP_ERRORS:
+                    _MODEL_ROUTER.record(current, time.perf_counter() - started, ok=False)
+                    if not auto_route:
+                        raise
+                    tried.append(current)
+                    remaining = [c for c in self._auto_candidates(base) if c not in tried]
+                    next_model = _MODEL_ROUTER.choose(remaining)
+                    if not next_model:
+                        raise
+                    self.log(f"[CoEModelPicker] auto routing: '{current}' failed; switching to '{next_model}'")
+                    payload["model"] = next_model
+                    routing["model_id"] = next_model
+                    routing["fallbacks"] += 1
+                    continue
+                _MODEL_ROUTER.record(current, time.perf_counter() - started, ok=True)
+                return resp
+
+        race_models = self._race_model_ids(base)
+
+        async def _race(payload: Dict[str, Any]) -> Dict[str, Any]:
+            """
+            같은 첫 턴 요청을 여러 모델에 동시에 보내고, 가장 먼저 도착한 유효 응답을 채택합니다.
+            나머지 요청은 취소하며, 승자와 격차(탈락 모델의 EWMA 추정 지연 기준)를 routing에 남깁니다.
+            """
+            started = time.perf_counter()
+            tasks: Dict[asyncio.Task, str] = {
+                asyncio.ensure_future(_dispatch(dict(payload, model=m), 1, racing=True)): m for m in race_models
+            }
+            pending = set(tasks)
+            failures: Dict[str, str] = {}
             try:
-                return await asyncio.to_thread(_http_post_json, url, payload, 30.0)
-            except (URLError, OSError, socket.gaierror):
-                if fallback_url:
-                    return await asyncio.to_thread(_http_post_json, fallback_url, payload, 30.0)
-                raise
-
-        for _ in range(8):
-            request_payload: Dict[str, Any] = {
-                "model": model_id or (model_name or ""),
-                "messages": conversation,
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        model = tasks[task]
+                        elapsed = time.perf_counter() - started
+                        try:
+                            resp = task.result()
+                        except _HTTP_ERRORS as e:
+                            _MODEL_ROUTER.record(model, elapsed, ok=False)
+                            failures[model] = str(_error_status(e) or type(e).__name__)
+                            continue
+                        if not _is_valid_chat_response(resp):
+                            failures[model] = "invalid response"
+                            continue
+                        _MODEL_ROUTER.record(model, elapsed, ok=True)
+                        losers = [m for t, m in tasks.items() if t in pending]
+                        estimates = _MODEL_ROUTER.estimates(losers)
+                        runner_up = min((v["latency_ms"] for v in estimates.values()), default=None)
+                        winner_ms = round(elapsed * 1000, 2)
+                        routing["model_id"] = model
+                        routing["race"] = {
+                            "candidates": list(race_models),
+                            "winner": model,
+                            "winner_ms": winner_ms,
+                            "cancelled": losers,
+                            "failed": failures,
+                            "margin_ms": round(runner_up - winner_ms, 2) if runner_up is not None else None,
+                        }
+                        _RACE_WINS.record(model)
+                        self.log(
+                            f"[CoEModelPicker] race won by '{model}' in {winner_ms}ms "
+                            f"(cancelled={len(losers)}, failed={len(failures)})"
+                        )
+                        return resp
+            finally:
+                for task in pending:
+                    task.cancel()
+                if pending:
+                    await asyncio.gather(*pending, return_exceptions=True)
+            raise RuntimeError(f"all raced models failed: {failures}")
+
+        budget = _ContextBudget(
+            int(getattr(self, "context_token_budget", 0) or 0),
+            int(getattr(self, "max_tool_output_tokens", 0) or 0),
+        )
+
+        def _expired() -> bool:
+            return deadline is not None and time.monotonic() >= deadline
+
+        def _deadline_result(iteration: int, phase: str) -> Dict[str, Any]:
+            self.log(
+                f"[CoEModelPicker] request deadline {deadline_s:g}s exceeded during {phase} "
+                f"(iteration {iteration}); returning partial answer"
+            )
+            final_payload = self._build_deadline_payload(
+                "".join(stream_parts), tool_results, last_response, conversation, deadline_s
+            )
+            final_payload["deadline"] = {
+                "budget_s": deadline_s,
+                "elapsed_s": round(deadline_s + time.monotonic() - deadline, 3),
+                "timed_out": True,
+                "phase": phase,
+                "iteration": iteration,
             }
+            self._attach_routing(final_payload, routing)
+            self._attach_prefix(final_payload, routing["model_id"] or model_name, conversation, tools_payload)
+            self._attach_timings(final_payload, trace)
+            self._log_pool_stats(served_by["url"], http2)
+            return final_payload
+
+        for iteration in range(1, 9):
+            if _expired():
+                # 첫 턴 전에 만료됐으면 모델 조회/도구 준비 단계에서 소진된 것
+                return _deadline_result(iteration, "tools" if iteration > 1 else "setup")
+            messages, compacted_groups = budget.compact(conversation, pinned=pinned)
+            if compacted_groups:
+                self.log(
+                    f"[CoEModelPicker] context compacted: {compacted_groups} earlier tool turn(s) summarized "
+                    f"({len(conversation)} -> {len(messages)} messages)"
+                )
+            # 고정 prefix(model → tools → system 메시지)를 앞에 두고 가변 대화는 뒤에 배치
+            request_payload: Dict[str, Any] = {"model": routing["model_id"] or (model_name or "")}
             if tools_payload:
                 request_payload["tools"] = tools_payload
                 if tool_choice_auto:
                     request_payload["tool_choice"] = "auto"
+            request_payload["messages"] = messages
 
-            resp = await _dispatch(request_payload)
+            if iteration == 1 and len(race_models) > 1:
+                call = _race(request_payload)
+            else:
+                call = _dispatch_routed(request_payload, iteration)
+            try:
+                if deadline is None:
+                    resp = await call
+                else:
+                    resp = await asyncio.wait_for(call, max(0.0, deadline - time.monotonic()))
+            except (asyncio.TimeoutError,) + _HTTP_ERRORS:
+                if not _expired():
+                    raise
+                return _deadline_result(iteration, "dispatch")
             last_response = resp
 
             choice0 = (resp.get("choices") or [{}])[0]
@@ -520,12 +3315,15 @@ class CoEModelPicker(Component):
                         )
                     continue
 
-                for call in tool_calls:
-                    result_text = await self._execute_tool_call(call, tool_map)
+                results = await self._run_tool_calls(
+                    tool_calls, tool_map, trace=trace, iteration=iteration, deadline=deadline
+                )
+                for call, (result_text, meta) in zip(tool_calls, results):
                     tool_results.append(
                         {
                             "name": call.get("function", {}).get("name"),
                             "output": result_text,
+                            **meta,
                         }
                     )
                     conversation.append(
@@ -533,13 +3331,16 @@ class CoEModelPicker(Component):
                             "role": "tool",
                             "tool_call_id": call.get("id") or str(uuid.uuid4()),
                             "name": call.get("function", {}).get("name"),
-                            "content": result_text,
+                            "content": budget.clip_tool_output(result_text),
                         }
                     )
                 continue
 
             final_payload = self._build_final_payload(msg, tool_results, last_response, conversation)
-            self._last_response = final_payload
+            self._attach_routing(final_payload, routing)
+            self._attach_prefix(final_payload, routing["model_id"] or model_name, conversation, tools_payload)
+            self._attach_timings(final_payload, trace)
+            self._log_pool_stats(served_by["url"], http2)
             return final_payload
 
         fallback_message = {
@@ -553,20 +3354,280 @@ class CoEModelPicker(Component):
             "raw": last_response or {},
             "conversation": conversation,
         }
-        self._last_response = final_payload
+        self._attach_routing(final_payload, routing)
+        self._attach_prefix(final_payload, routing["model_id"] or model_name, conversation, tools_payload)
+        self._attach_timings(final_payload, trace)
+        self._log_pool_stats(served_by["url"], http2)
+        return final_payload
+
+    def _build_deadline_payload(
+        self,
+        streamed_text: str,
+        tool_results: List[Dict[str, Any]],
+        last_response: Optional[Dict[str, Any]],
+        conversation: List[Dict[str, Any]],
+        deadline_s: float,
+    ) -> Dict[str, Any]:
+        """
+        deadline 초과 시 지금까지의 최선 부분 응답을 만듭니다.
+        현재 턴의 스트리밍 텍스트 → 마지막 assistant 본문 → 완료된 도구 결과 요약 순으로 사용합니다.
+        """
+        partial = streamed_text.strip()
+        if not partial:
+            for message in reversed(conversation):
+                if message.get("role") == "assistant" and message.get("content"):
+                    partial = str(message["content"]).strip()
+                    break
+        if not partial and tool_results:
+            partial = "\n".join(
+                f"- {r.get('name')}: {str(r.get('output') or '')[:LEAN_TOOL_OUTPUT_CHARS]}"
+                for r in tool_results
+                if not r.get("error")
+            )
+        marker = f"[요청 시간 한도 {deadline_s:g}s 초과로 중단된 부분 응답입니다.]"
+        text = f"{partial}\n\n{marker}" if partial else marker
+        final_payload = self._build_final_payload(
+            {"role": "assistant", "content": text}, tool_results, last_response, conversation
+        )
+        final_payload["message"]["data"]["timed_out"] = True
         return final_payload
 
-    async def _execute_tool_call(self, tool_call: Dict[str, Any], tool_map: Dict[str, Any]) -> str:
+    @staticmethod
+    def _attach_prefix(
+        final_payload: Dict[str, Any],
+        model: str,
+        conversation: List[Dict[str, Any]],
+        tools_payload: List[Dict[str, Any]],
+    ) -> None:
+        """prefix 지문과 백엔드가 보고한 캐시 토큰 수(usage.prompt_tokens_details.cached_tokens)를 기록."""
+        usage = (final_payload.get("raw") or {}).get("usage") or {}
+        info = {
+            "fingerprint": _prefix_fingerprint(str(model or ""), conversation, tools_payload),
+            "prompt_tokens": usage.get("prompt_tokens"),
+            "cached_tokens": (usage.get("prompt_tokens_details") or {}).get("cached_tokens"),
+        }
+        final_payload["prefix"] = info
+        message = final_payload.get("message")
+        if isinstance(message, dict):
+            message.setdefault("data", {"text": message.get("text", "")})["prefix"] = info
+
+    @staticmethod
+    def _attach_routing(final_payload: Dict[str, Any], routing: Dict[str, Any]) -> None:
+        info = dict(routing)
+        if info["mode"] == "auto":
+            info["estimates"] = _MODEL_ROUTER.estimates()
+        final_payload["routing"] = info
+        message = final_payload.get("message")
+        if isinstance(message, dict):
+            message.setdefault("data", {"text": message.get("text", "")})["routing"] = info
+
+    @staticmethod
+    def _attach_timings(final_payload: Dict[str, Any], trace: _Trace) -> None:
+        """요약은 payload/Message data에, 개별 span 목록은 payload["trace"]에 둡니다."""
+        summary = trace.finish()
+        final_payload["timings"] = summary
+        final_payload["trace"] = trace.spans
+        message = final_payload.get("message")
+        if isinstance(message, dict):
+            message.setdefault("data", {"text": message.get("text", "")})["timings"] = summary
+
+    def _retry_policy(self) -> _RetryPolicy:
+        return _RetryPolicy(
+            max_retries=int(getattr(self, "max_retries", 2) or 0),
+            retry_statuses=_parse_status_classes(getattr(self, "retry_statuses", "429,502,503,504")),
+            base_delay=float(getattr(self, "retry_backoff_base", 0.5) or 0.0),
+        )
+
+    HEDGE_DEFAULT_DELAY = 2.0
+    HEDGE_MIN_DELAY = 0.05
+
+    def _hedge_delay(self, base: str) -> float:
+        """최근 dispatch 지연의 p95. 표본이 부족하면 기본값을 씁니다."""
+        p95 = _DISPATCH_LATENCY.quantile(base, 0.95)
+        return max(self.HEDGE_MIN_DELAY, p95 if p95 is not None else self.HEDGE_DEFAULT_DELAY)
+
+    def _log_pool_stats(self, url: str, http2: bool) -> None:
+        # 배치 실행 중에는 항목마다 찍지 않고 배치 종료 시 한 번만 기록
+        if httpx is None or getattr(self, "_batch_running", False):
+            return
+        stats = _get_http_pool(url, http2).stats()
+        self.log(
+            f"[CoEModelPicker] http pool {stats['origin']}: requests={stats['requests']} "
+            f"new={stats['new_connections']} reused={stats['reused_connections']} "
+            f"reuse_ratio={stats['reuse_ratio']}"
+        )
+
+    def _lookup_model_id(self, model_name: str, base: str) -> str:
+        name = model_name or ""
+        if name in self._name_to_id:
+            return self._name_to_id[name]
+        for pairs in (_MODEL_CATALOG.peek(base) or [], self._fallback_pairs()):
+            for n, mid in pairs:
+                if n == name:
+                    return mid
+        return ""
+
+    def _race_model_ids(self, base: str) -> List[str]:
+        """race_models 입력(이름 또는 id)을 카탈로그 기준 id 목록으로 변환합니다. 중복은 제거."""
+        ids: List[str] = []
+        for name in str(getattr(self, "race_models", "") or "").split(","):
+            name = name.strip()
+            if not name:
+                continue
+            model_id = self._lookup_model_id(name, base) or name
+            if model_id not in ids:
+                ids.append(model_id)
+        return ids
+
+    def _auto_candidates(self, base: str) -> List[str]:
+        """자동 선택 후보 모델 id (auto_model_tier가 있으면 그 목록, 없으면 카탈로그의 채팅 모델)."""
+        pairs = _MODEL_CATALOG.peek(base) or self._fallback_pairs()
+        tier = [t.strip() for t in str(getattr(self, "auto_model_tier", "") or "").split(",") if t.strip()]
+        if tier:
+            by_name = {n: mid for n, mid in pairs}
+            known_ids = {mid for _, mid in pairs}
+            return [by_name.get(t) or t for t in tier if t in by_name or t in known_ids]
+        return [mid for name, mid in pairs if "embedding" not in (name + mid).lower()]
+
+    async def _resolve_model_id(
+        self,
+        model_name: str,
+        base: str,
+        deadline: Optional[float] = None,
+        backends: Optional[List[str]] = None,
+    ) -> str:
+        """
+        선택된 모델 이름을 해당 백엔드 카탈로그 기준 id로 변환합니다. 자동 선택이면 라우터가 고릅니다.
+        deadline이 있으면 카탈로그 조회(공유 fetch 대기 포함)는 남은 시간까지만 기다립니다.
+        backends는 base 실패 시 카탈로그를 받을 같은 풀의 백엔드 목록입니다.
+        """
+
+        def _fetch(b: str) -> List[Tuple[str, str]]:
+            return self._fetch_models(b, deadline=deadline, backends=backends)
+
+        async def _load_catalog() -> None:
+            if deadline is None:
+                await asyncio.to_thread(_MODEL_CATALOG.get, base, _fetch)
+                return
+            remaining = max(0.0, deadline - time.monotonic())
+            await asyncio.wait_for(
+                asyncio.to_thread(_MODEL_CATALOG.get, base, _fetch, wait_timeout=min(20.0, remaining)),
+                remaining,
+            )
+
+        if model_name == AUTO_MODEL_OPTION:
+            if _MODEL_CATALOG.peek(base) is None:
+                try:
+                    await _load_catalog()
+                except Exception as e:
+                    self.log(f"[CoEModelPicker] model catalog fetch failed: {e}")
+            model_id = _MODEL_ROUTER.choose(self._auto_candidates(base))
+            if model_id:
+                return model_id
+        model_id = self._lookup_model_id(model_name, base)
+        if not model_id and model_name and _MODEL_CATALOG.peek(base) is None:
+            # 이 워커에서 아직 카탈로그를 받지 않은 백엔드 → 공유 fetch 1회
+            try:
+                await _load_catalog()
+            except Exception as e:
+                self.log(f"[CoEModelPicker] model catalog fetch failed: {e}")
+            model_id = self._lookup_model_id(model_name, base)
+        if not model_id:
+            fpairs = self._fallback_pairs()
+            if fpairs:
+                model_id = fpairs[0][1]
+        return model_id
+
+    async def _run_tool_calls(
+        self,
+        tool_calls: List[Dict[str, Any]],
+        tool_map: Dict[str, Any],
+        trace: Optional[_Trace] = None,
+        iteration: int = 0,
+        deadline: Optional[float] = None,
+    ) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        한 턴의 tool_calls를 세마포어로 동시 실행 수를 제한하여 병렬 실행합니다.
+        결과는 tool_calls 순서 그대로 반환되어 대화 기록이 결정적으로 유지됩니다.
+        deadline(time.monotonic 기준)이 있으면 각 도구는 tool_timeout과 남은 시간 중 짧은 쪽만 사용합니다.
+        """
+        limit = max(1, int(getattr(self, "max_parallel_tools", 4) or 1))
+        timeout = float(getattr(self, "tool_timeout", 0) or 0)
+        semaphore = asyncio.Semaphore(limit)
+
+        async def _run_one(call: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+            started = time.perf_counter()
+            text, meta = await _run_limited(call)
+            if trace is not None:
+                timing = meta.get("timing") or {}
+                trace.record(
+                    "tool",
+                    time.perf_counter() - started,
+                    {
+                        "name": (call.get("function") or {}).get("name"),
+                        "iteration": iteration,
+                        "output_bytes": len(text.encode("utf-8")),
+                        "executor": timing.get("executor"),
+                        "queued_ms": timing.get("queued_ms"),
+                        "error": bool(meta.get("error")),
+                        "cache_hit": bool(meta.get("cache_hit")),
+                    },
+                )
+            return text, meta
+
+        async def _run_limited(call: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+            async with semaphore:
+                name = (call.get("function") or {}).get("name")
+                limit_s = timeout
+                by_deadline = False
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return f"Tool '{name}' skipped: request deadline exceeded.", {
+                            "error": True,
+                            "timed_out": True,
+                            "deadline": True,
+                        }
+                    if limit_s <= 0 or remaining < limit_s:
+                        limit_s, by_deadline = remaining, True
+                coro = self._execute_tool_call(call, tool_map)
+                if limit_s <= 0:
+                    return await coro
+                try:
+                    return await asyncio.wait_for(coro, limit_s)
+                except asyncio.TimeoutError:
+                    self.log(f"[CoEModelPicker] Tool '{name}' timed out after {limit_s:g}s")
+                    meta: Dict[str, Any] = {"error": True, "timed_out": True}
+                    if by_deadline:
+                        meta["deadline"] = True
+                    return f"Tool '{name}' timed out after {limit_s:g}s.", meta
+
+        tasks = [asyncio.ensure_future(_run_one(call)) for call in tool_calls]
+        try:
+            return list(await asyncio.gather(*tasks))
+        finally:
+            # 상위 취소/예외 시 남은 도구 실행도 함께 취소
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _execute_tool_call(
+        self, tool_call: Dict[str, Any], tool_map: Dict[str, Any]
+    ) -> Tuple[str, Dict[str, Any]]:
+        """도구 1회 실행. (출력 텍스트, tool_results에 병합할 메타데이터) 반환."""
         name = ((tool_call.get("function") or {}).get("name") or "").strip()
         if not name:
-            return "Tool call missing function name."
+            return "Tool call missing function name.", {"error": True}
         tool = tool_map.get(name)
         if tool is None:
-            return f"Tool '{name}' is not available."
+            return f"Tool '{name}' is not available.", {"error": True}
 
         arguments_raw = (tool_call.get("function") or {}).get("arguments") or "{}"
         try:
-            arguments = json.loads(arguments_raw) if arguments_raw else {}
+            if isinstance(arguments_raw, dict):
+                arguments = arguments_raw
+            else:
+                arguments = _json_loads(arguments_raw) if arguments_raw else {}
         except Exception as e:
             self.log(f"[CoEModelPicker] Failed to parse tool arguments for '{name}': {e}")
             arguments = {}
@@ -574,34 +3635,126 @@ class CoEModelPicker(Component):
         if not isinstance(arguments, dict):
             arguments = {"input": arguments}
 
+        cache_ttl = self._tool_cache_ttl(tool)
+        if cache_ttl <= 0:
+            return await self._run_tool(tool, name, arguments)
+
+        # 캐시 가능 도구: 같은 (도구, 인자)는 캐시 → 진행 중 실행 공유 → 실제 실행 순으로 처리
+        key = _tool_result_key(tool, name, arguments)
+        cached = _TOOL_RESULTS.get(key)
+        if cached is not None:
+            return cached, {"cache_hit": True, "timing": {"executor": "cache"}}
+
+        async def _leader() -> Tuple[str, Dict[str, Any]]:
+            text, meta = await self._run_tool(tool, name, arguments)
+            if not meta.get("error"):
+                _TOOL_RESULTS.put(key, text, cache_ttl, int(getattr(self, "tool_cache_size", 512) or 512))
+            return text, meta
+
+        (text, meta), coalesced = await _TOOL_SINGLE_FLIGHT.run(key, _leader)
+        return text, dict(meta, cache_hit=coalesced)
+
+    async def _run_tool(self, tool: Any, name: str, arguments: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        timing: Dict[str, Any] = {}
         try:
-            result = await self._invoke_structured_tool(tool, arguments)
-            return self._format_tool_output(result)
+            result = await self._invoke_structured_tool(tool, arguments, timing)
+            return self._format_tool_output(result), {"timing": timing}
         except Exception as e:
             self.log(f"[CoEModelPicker] Tool '{name}' execution failed: {e}")
-            return f"Tool '{name}' execution failed: {e}"
+            return f"Tool '{name}' execution failed: {e}", {"error": True, "timing": timing}
 
-    async def _invoke_structured_tool(self, tool: Any, arguments: Dict[str, Any]) -> Any:
-        if hasattr(tool, "ainvoke") and callable(getattr(tool, "ainvoke")):
-            return await tool.ainvoke(arguments)
-        if hasattr(tool, "invoke") and callable(getattr(tool, "invoke")):
-            result = tool.invoke(arguments)
-            if inspect.isawaitable(result):
-                return await result
-            return result
-        if hasattr(tool, "arun") and callable(getattr(tool, "arun")):
-            return await tool.arun(**arguments)
-        if hasattr(tool, "run") and callable(getattr(tool, "run")):
-            result = tool.run(**arguments)
-            if inspect.isawaitable(result):
-                return await result
-            return result
-        if callable(tool):
-            result = tool(**arguments)
+    def _tool_cache_ttl(self, tool: Any) -> float:
+        """캐시 가능 도구면 TTL(초), 아니면 0. metadata의 cacheable/cache_ttl 또는 cacheable_tools 입력으로 지정."""
+        metadata = getattr(tool, "metadata", None) or {}
+        if not isinstance(metadata, dict):
+            metadata = {}
+        names = {n.strip() for n in str(getattr(self, "cacheable_tools", "") or "").split(",") if n.strip()}
+        name = str(getattr(tool, "name", "") or "")
+        if not (metadata.get("cacheable") or "*" in names or name in names):
+            return 0.0
+        ttl = metadata.get("cache_ttl", getattr(self, "tool_cache_ttl", 300))
+        try:
+            return max(0.0, float(ttl or 0))
+        except (TypeError, ValueError):
+            return 0.0
+
+    def _tool_concurrency_limit(self, tool: Any) -> int:
+        metadata = getattr(tool, "metadata", None) or {}
+        limit = metadata.get("max_concurrency") if isinstance(metadata, dict) else None
+        if limit is None:
+            limit = getattr(self, "tool_concurrency_limit", 0)
+        try:
+            return max(0, int(limit or 0))
+        except (TypeError, ValueError):
+            return 0
+
+    def _is_cpu_bound_tool(self, tool: Any) -> bool:
+        metadata = getattr(tool, "metadata", None) or {}
+        if isinstance(metadata, dict) and metadata.get("cpu_bound"):
+            return True
+        names = {n.strip() for n in str(getattr(self, "cpu_bound_tools", "") or "").split(",") if n.strip()}
+        return str(getattr(tool, "name", "") or "") in names
+
+    async def _invoke_structured_tool(
+        self, tool: Any, arguments: Dict[str, Any], timing: Optional[Dict[str, Any]] = None
+    ) -> Any:
+        """
+        async 구현이 있는 도구는 이벤트 루프에서, 동기 도구는 스레드(또는 CPU-bound면 프로세스) 풀에서 실행합니다.
+        timing에는 대기(queued_ms)/실행(exec_ms) 시간과 실행 위치(executor)를 기록합니다.
+        """
+        timing = timing if timing is not None else {}
+        queued_at = time.time()
+        limit = self._tool_concurrency_limit(tool)
+        semaphore = _get_tool_semaphore(str(getattr(tool, "name", "") or id(tool)), limit) if limit else None
+        if semaphore is not None:
+            await semaphore.acquire()
+        # executor에 제출한 현재 작업 (타임아웃/취소로 대기를 그만둬도 작업 스레드는 계속 실행됨)
+        pending: Optional[Future] = None
+        try:
+            if not _is_sync_tool(tool):
+                started = time.time()
+                timing.update(executor="loop", queued_ms=round((started - queued_at) * 1000, 2))
+                try:
+                    if hasattr(tool, "ainvoke") and callable(getattr(tool, "ainvoke")):
+                        return await tool.ainvoke(arguments)
+                    return await tool.arun(**arguments)
+                finally:
+                    timing["exec_ms"] = round((time.time() - started) * 1000, 2)
+
+            loop = asyncio.get_running_loop()
+            kind = "thread"
+            if self._is_cpu_bound_tool(tool):
+                try:
+                    pending = _get_tool_executor("process", TOOL_PROCESS_WORKERS).submit(
+                        _run_sync_tool, tool, arguments
+                    )
+                    result, started, finished = await asyncio.wrap_future(pending)
+                    kind = "process"
+                except (pickle.PicklingError, BrokenProcessPool, TypeError, AttributeError) as e:
+                    # 피클링 불가/풀 손상 → 스레드 풀로 폴백 (도구 자체 예외는 그대로 전파)
+                    if isinstance(e, (TypeError, AttributeError)) and "pickle" not in str(e).lower():
+                        raise
+                    self.log(f"[CoEModelPicker] process pool unavailable for '{getattr(tool, 'name', '')}': {e}")
+                    kind = "thread"
+            if kind == "thread":
+                workers = int(getattr(self, "tool_thread_workers", 8) or 8)
+                pending = _get_tool_executor("thread", workers).submit(_run_sync_tool, tool, arguments)
+                result, started, finished = await asyncio.wrap_future(pending)
+            timing.update(
+                executor=kind,
+                queued_ms=round(max(0.0, started - queued_at) * 1000, 2),
+                exec_ms=round((finished - started) * 1000, 2),
+            )
             if inspect.isawaitable(result):
                 return await result
             return result
-        raise RuntimeError("Tool object is not callable")
+        finally:
+            if semaphore is not None:
+                if pending is not None and not pending.done():
+                    # 도구별 동시 실행 한도는 실제 작업이 끝날 때까지 유지
+                    pending.add_done_callback(_release_when_done(loop, semaphore))
+                else:
+                    semaphore.release()
 
     def _format_tool_output(self, result: Any) -> str:
         if result is None:
@@ -610,19 +3763,19 @@ class CoEModelPicker(Component):
             return result
         try:
             if hasattr(result, "model_dump"):
-                return json.dumps(result.model_dump(), ensure_ascii=False)
+                return _json_dumps_text(result.model_dump())
             if hasattr(result, "dict"):
-                return json.dumps(result.dict(), ensure_ascii=False)
+                return _json_dumps_text(result.dict())
             if isinstance(result, dict):
-                return json.dumps(result, ensure_ascii=False)
+                return _json_dumps_text(result)
             if hasattr(result, "to_json"):
                 return result.to_json()
             if hasattr(result, "to_dict"):
-                return json.dumps(result.to_dict(), ensure_ascii=False)
+                return _json_dumps_text(result.to_dict())
         except Exception:
             pass
         try:
-            return json.dumps(result, ensure_ascii=False, default=str)
+            return _json_dumps_text(result)
         except Exception:
             return str(result)
 
@@ -668,6 +3821,13 @@ class CoEModelPicker(Component):
         return final_payload
 
     def _prepare_message_output(self, response_payload: Dict[str, Any]) -> Any:
+        started = time.perf_counter()
+        try:
+            return self._build_message_output(response_payload, started)
+        finally:
+            _observe_phase("output_prepare", time.perf_counter() - started)
+
+    def _build_message_output(self, response_payload: Dict[str, Any], started: float) -> Any:
         message_section = (
             response_payload.get("message") if isinstance(response_payload, dict) else None
         )
@@ -679,7 +3839,22 @@ class CoEModelPicker(Component):
         data_block = message_section.get("data") or {}
         if tool_calls and not data_block:
             data_block = {"tool_calls": tool_calls}
-        if raw_response is not None:
+
+        profile = str(getattr(self, "output_profile", "full") or "full").lower()
+        if profile in {"lean", "lazy"} and isinstance(response_payload, dict):
+            # 원본 응답/도구 출력 사본 대신 요약(lean) 또는 참조(lazy)만 Message에 저장
+            data_block = dict(data_block)
+            tool_results = data_block.pop("tool_results", None) or []
+            data_block["raw_summary"] = _summarize_raw_response(raw_response)
+            if profile == "lean":
+                if tool_results:
+                    data_block["tool_results"] = _summarize_tool_results(tool_results)
+            else:
+                data_block["response_ref"] = _PAYLOAD_REFS.put(response_payload)
+                data_block["tool_result_count"] = len(tool_results)
+            data_block["output_profile"] = profile
+            raw_response = None
+        elif raw_response is not None:
             data_block.setdefault("raw_response", raw_response)
 
         content = message_section.get("content")
@@ -693,6 +3868,10 @@ class CoEModelPicker(Component):
         data_block.setdefault("text", content)
         if tool_calls:
             data_block.setdefault("tool_calls", tool_calls)
+        if isinstance(data_block.get("timings"), dict):
+            data_block["timings"] = dict(
+                data_block["timings"], output_prepare_ms=round((time.perf_counter() - started) * 1000, 2)
+            )
 
         if Message is not None:
             try:
@@ -730,7 +3909,7 @@ class CoEModelPicker(Component):
                 tool_calls = message_section.get("tool_calls")
                 if tool_calls:
                     try:
-                        return json.dumps({"tool_calls": tool_calls}, ensure_ascii=False)
+                        return _json_dumps_text({"tool_calls": tool_calls})
                     except Exception:
                         return "[tool_calls]"
                 content = message_section.get("content")
@@ -739,45 +3918,154 @@ class CoEModelPicker(Component):
                 if content is None:
                     content = ""
                 return str(content)
-            return json.dumps(response_payload, ensure_ascii=False)
+            return _json_dumps_text(response_payload)
         return str(response_payload)
 
     # ─────────────────────────────────────────────────────────────────────────
-    # Outputs 구현
-    async def run_message(self, **kwargs: Any):
-        (
-            chat_text,
-            prompt,
-            model_name,
-            backend_url,
-            force_https,
-            enable_tools,
-            tool_choice_auto,
-        ) = self._collect_inputs()
-        signature = self._build_request_signature(
-            chat_text,
-            prompt,
-            model_name,
-            backend_url,
-            force_https,
-            enable_tools,
-            tool_choice_auto,
-        )
-        if self._last_request_signature != signature:
-            self._last_response = None
-            self._last_request_signature = signature
-        response_payload = await self._call_chat(
-            chat_text,
-            prompt,
-            model_name,
-            backend_url,
-            force_https,
-            enable_tools,
-            tool_choice_auto,
-        )
-        return self._prepare_message_output(response_payload)
+    # 스트리밍 출력
+    _STREAM_FLUSH_INTERVAL = 0.05
 
-    async def run_text(self, **kwargs: Any) -> str:
+    def _build_stream_sink(
+        self,
+    ) -> Tuple[Optional[Callable[[str], Awaitable[None]]], Dict[str, Any]]:
+        """
+        chat_output Message에 부분 텍스트를 밀어 넣는 on_delta 콜백을 만듭니다.
+        스트리밍이 꺼져 있거나 send_message를 지원하지 않는 Langflow 버전이면 (None, {}).
+        """
+        streamed: Dict[str, Any] = {}
+        send_message = getattr(self, "send_message", None)
+        if not bool(getattr(self, "stream", False)) or Message is None or not callable(send_message):
+            return None, streamed
+
+        parts: List[str] = []
+        state = {"last_flush": 0.0}
+
+        async def _on_delta(text_delta: str) -> None:
+            parts.append(text_delta)
+            now = time.monotonic()
+            if now - state["last_flush"] < self._STREAM_FLUSH_INTERVAL:
+                return
+            state["last_flush"] = now
+            try:
+                message = streamed.get("message")
+                if message is None:
+                    message = Message(text="".join(parts), sender="AI")  # type: ignore[call-arg]
+                else:
+                    message.text = "".join(parts)
+                stored = await send_message(message)
+                streamed["message"] = stored if stored is not None else message
+            except Exception as e:
+                self.log(f"[CoEModelPicker] stream update failed: {e}")
+
+        return _on_delta, streamed
+
+    # ─────────────────────────────────────────────────────────────────────────
+    # 응답 캐시
+    def _response_cache(self) -> Optional[_ResponseCache]:
+        if float(getattr(self, "response_cache_ttl", 0) or 0) <= 0:
+            return None
+        try:
+            return _get_response_cache(getattr(self, "response_cache_path", "") or None)
+        except Exception as e:
+            self.log(f"[CoEModelPicker] response cache unavailable: {e}")
+            return _get_response_cache(None)
+
+    def _response_cache_ttl(self, payload: Dict[str, Any]) -> float:
+        """
+        응답 캐시에 저장할 TTL. deadline으로 잘린 부분 응답, 실패한 도구 결과,
+        캐시 가능으로 지정되지 않은 도구의 결과가 포함된 응답은 저장하지 않습니다(0).
+        도구를 사용한 응답은 해당 도구들의 결과 캐시 TTL을 넘겨 보관하지 않습니다.
+        """
+        ttl = float(getattr(self, "response_cache_ttl", 0) or 0)
+        if ttl <= 0 or (payload.get("deadline") or {}).get("timed_out"):
+            return 0.0
+        tool_results = ((payload.get("message") or {}).get("data") or {}).get("tool_results") or []
+        if not tool_results:
+            return ttl
+        tools = {
+            str(getattr(tool, "name", "") or ""): tool
+            for tool in (self.tools if isinstance(getattr(self, "tools", None), list) else [])
+        }
+        for result in tool_results:
+            tool = tools.get(str(result.get("name") or ""))
+            if tool is None or result.get("error"):
+                return 0.0
+            ttl = min(ttl, self._tool_cache_ttl(tool))
+        return ttl
+
+    def _record_trace(self, chat_text: str, prompt: str, model_name: str, payload: Dict[str, Any]) -> None:
+        cached_tools = getattr(self, "_tools_payload_cache", None)
+        try:
+            _TRACE_RECORDER.write(
+                _trace_record_entry(chat_text, prompt, model_name, list(cached_tools[1]) if cached_tools else [], payload)
+            )
+        except Exception as e:
+            self.log(f"[CoEModelPicker] trace record failed: {e}")
+
+    def _session_id(self) -> str:
+        """session_memory가 켜져 있으면 session_id 입력 → chat_input Message → 그래프 세션 순으로 결정."""
+        if not bool(getattr(self, "session_memory", False)):
+            return ""
+        session_id = str(getattr(self, "session_id", "") or "").strip()
+        if not session_id:
+            session_id = str(getattr(getattr(self, "chat_input", None), "session_id", "") or "")
+        if not session_id:
+            graph = getattr(self, "graph", None)
+            session_id = str(getattr(graph, "session_id", "") or "") if graph is not None else ""
+        return session_id
+
+    async def _record_session_turn(
+        self,
+        store: Optional[_SessionStore],
+        session_id: str,
+        state: Dict[str, Any],
+        chat_text: str,
+        payload: Dict[str, Any],
+    ) -> None:
+        """완료된 턴을 세션 창에 추가하고 payload에 세션 정보를 남깁니다(deadline 부분 응답은 제외)."""
+        message = payload.get("message") or {}
+        info: Dict[str, Any] = {
+            "id": session_id,
+            "revision": state.get("revision", 0),
+            "history_messages": len(_session_history(state)),
+            "summary_lines": len(state.get("summary") or []),
+        }
+        if store is not None and not (payload.get("deadline") or {}).get("timed_out"):
+            try:
+                # 다른 워커가 그 사이 같은 세션을 갱신했으면 최신 상태를 다시 읽어 이번 턴을 덧붙임
+                for _ in range(3):
+                    new_state = _apply_session_turn(
+                        state,
+                        chat_text,
+                        str(message.get("content") or message.get("text") or ""),
+                        int(getattr(self, "session_window_tokens", 4000) or 0),
+                        int(getattr(self, "session_summary_tokens", 600) or 0),
+                    )
+                    if await asyncio.to_thread(store.save, session_id, new_state, int(state.get("revision") or 0)):
+                        info["revision"] = new_state["revision"]
+                        break
+                    self.log(f"[CoEModelPicker] session '{session_id}' changed concurrently; reapplying turn")
+                    state = await asyncio.to_thread(store.load, session_id)
+                else:
+                    self.log(f"[CoEModelPicker] session '{session_id}' save failed: too many concurrent updates")
+            except Exception as e:
+                self.log(f"[CoEModelPicker] session save failed: {e}")
+        payload["session"] = info
+        if isinstance(message, dict):
+            message.setdefault("data", {"text": message.get("text", "")})["session"] = info
+
+    async def _get_response(
+        self,
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+        chat_text_override: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        세 출력(run_message/run_text/run_response)과 배치 항목이 공유하는 응답 조회.
+        인스턴스 메모 → 응답 캐시 → _call_chat 순으로 확인합니다.
+        request_deadline은 여기서부터(모델 id 조회 포함) 계산합니다.
+        """
+        deadline_s = float(getattr(self, "request_deadline", 0) or 0)
+        deadline = time.monotonic() + deadline_s if deadline_s > 0 else None
         (
             chat_text,
             prompt,
@@ -787,6 +4075,8 @@ class CoEModelPicker(Component):
             enable_tools,
             tool_choice_auto,
         ) = self._collect_inputs()
+        if chat_text_override is not None:
+            chat_text = chat_text_override
         signature = self._build_request_signature(
             chat_text,
             prompt,
@@ -796,11 +4086,54 @@ class CoEModelPicker(Component):
             enable_tools,
             tool_choice_auto,
         )
-        if self._last_request_signature != signature:
-            self._last_response = None
-            self._last_request_signature = signature
-        if self._last_response is None:
-            response_payload = await self._call_chat(
+        base = self._normalize(backend_url or DEFAULT_BACKEND, bool(force_https))
+        race_models = self._race_model_ids(base)
+        if len(race_models) > 1:
+            model_id = "race:" + ",".join(race_models)
+        elif model_name == AUTO_MODEL_OPTION:
+            # 자동 선택은 라우팅 결과와 무관하게 같은 요청이면 같은 캐시 키
+            model_id = AUTO_MODEL_KEY
+        else:
+            model_id = await self._resolve_model_id(
+                model_name, base, deadline, self._backend_list(backend_url, bool(force_https))
+            )
+        memo_key = _response_cache_key(signature, model_id)
+
+        # 같은 실행의 다른 출력은 세션 갱신 전 응답을 그대로 공유
+        memo = getattr(self, "_response_memo", None)
+        if memo is not None and memo[0] == memo_key:
+            return memo[1]
+
+        # 세션 메모리 (배치 항목에는 적용하지 않음)
+        session_id = self._session_id() if chat_text_override is None else ""
+        session_store: Optional[_SessionStore] = None
+        session_state = _new_session_state()
+        if session_id:
+            try:
+                session_store = _get_session_store(getattr(self, "session_store", "") or None)
+                session_state = await asyncio.to_thread(session_store.load, session_id)
+            except Exception as e:
+                self.log(f"[CoEModelPicker] session store unavailable: {e}")
+                session_store = None
+            signature = signature + (session_id, session_state.get("revision", 0))
+        cache_key = _response_cache_key(signature, model_id)
+
+        cache = self._response_cache()
+        cache_size = int(getattr(self, "response_cache_size", 256) or 256)
+        if cache is not None:
+            # SQLite 계층은 조회/기록 시 디스크 I/O가 있으므로 이벤트 루프 밖에서 실행
+            if cache.path:
+                cached = await asyncio.to_thread(cache.get, cache_key, cache_size)
+            else:
+                cached = cache.get(cache_key, cache_size)
+            if cached is not None:
+                stats = cache.stats()
+                self.log(f"[CoEModelPicker] response cache hit (hits={stats['hits']} misses={stats['misses']})")
+                self._response_memo = (memo_key, cached)
+                return cached
+
+        async def _leader() -> Dict[str, Any]:
+            payload = await self._call_chat(
                 chat_text,
                 prompt,
                 model_name,
@@ -808,45 +4141,55 @@ class CoEModelPicker(Component):
                 force_https,
                 enable_tools,
                 tool_choice_auto,
+                on_delta=on_delta,
+                history=_session_history(session_state) if session_id else None,
+                deadline=deadline,
             )
-        else:
-            response_payload = self._last_response
+            if session_id:
+                await self._record_session_turn(session_store, session_id, session_state, chat_text, payload)
+            if _TRACE_RECORDER is not None:
+                self._record_trace(chat_text, prompt, model_name, payload)
+            ttl = self._response_cache_ttl(payload) if cache is not None else 0.0
+            if ttl > 0:
+                if cache.path:
+                    await asyncio.to_thread(cache.put, cache_key, payload, ttl, cache_size)
+                else:
+                    cache.put(cache_key, payload, ttl, cache_size)
+            return payload
+
+        # 같은 실행(컴포넌트 인스턴스)에서 동시에 평가되는 출력들만 하나의 _call_chat 결과를 공유.
+        # 다른 흐름/사용자의 요청은 도구(사용자별 데이터)와 스트림/deadline 설정이 다를 수 있어 합치지 않음
+        response_payload, coalesced = await _CHAT_SINGLE_FLIGHT.run(f"{id(self)}:{cache_key}", _leader)
+        if coalesced:
+            stats = _CHAT_SINGLE_FLIGHT.stats()
+            self.log(
+                f"[CoEModelPicker] coalesced with in-flight request "
+                f"(saved backend calls: {stats['coalesced']}, leaders: {stats['leaders']})"
+            )
+        self._response_memo = (memo_key, response_payload)
+        return response_payload
+
+    # ─────────────────────────────────────────────────────────────────────────
+    # Outputs 구현
+    async def run_message(self, **kwargs: Any):
+        on_delta, streamed = self._build_stream_sink()
+        response_payload = await self._get_response(on_delta=on_delta)
+        result = self._prepare_message_output(response_payload)
+        # 스트리밍 중 저장된 메시지를 최종 메시지로 갱신하도록 id 유지
+        stream_id = getattr(streamed.get("message"), "id", None)
+        if stream_id and Message is not None and isinstance(result, Message):
+            try:
+                result.id = stream_id
+            except Exception:
+                pass
+        return result
+
+    async def run_text(self, **kwargs: Any) -> str:
+        response_payload = await self._get_response()
         return self._prepare_text_output(response_payload)
 
     async def run_response(self, **kwargs: Any):
-        (
-            chat_text,
-            prompt,
-            model_name,
-            backend_url,
-            force_https,
-            enable_tools,
-            tool_choice_auto,
-        ) = self._collect_inputs()
-        signature = self._build_request_signature(
-            chat_text,
-            prompt,
-            model_name,
-            backend_url,
-            force_https,
-            enable_tools,
-            tool_choice_auto,
-        )
-        if self._last_request_signature != signature:
-            self._last_response = None
-            self._last_request_signature = signature
-        if self._last_response is None:
-            response_payload = await self._call_chat(
-                chat_text,
-                prompt,
-                model_name,
-                backend_url,
-                force_https,
-                enable_tools,
-                tool_choice_auto,
-            )
-        else:
-            response_payload = self._last_response
+        response_payload = await self._get_response()
         result = self._prepare_message_output(response_payload)
         if isinstance(result, dict):
             return result
@@ -854,6 +4197,66 @@ class CoEModelPicker(Component):
             return result
         return {"text": str(result), "sender": "AI"}
 
+    async def run_batch(self, **kwargs: Any) -> List[Any]:
+        """
+        batch_inputs의 각 항목을 동시 실행 수/초당 시작 수 제한 하에 처리하고 입력 순서대로 반환합니다.
+        도구 payload, 모델 카탈로그, 커넥션 풀, 응답 캐시는 모든 항목이 공유합니다.
+        """
+        items = _expand_batch_items(getattr(self, "batch_inputs", None))
+        if not items:
+            return []
+
+        concurrency = max(1, int(getattr(self, "batch_concurrency", 8) or 1))
+        semaphore = asyncio.Semaphore(concurrency)
+        limiter = _RateLimiter(float(getattr(self, "batch_rate_limit", 0) or 0))
+        started = time.perf_counter()
+
+        async def _run_item(index: int, item: Any) -> Dict[str, Any]:
+            text = _batch_item_text(item)
+            async with semaphore:
+                await limiter.acquire()
+                try:
+                    response_payload = await self._get_response(chat_text_override=text)
+                except Exception as e:
+                    self.log(f"[CoEModelPicker] batch item {index} failed: {e}")
+                    return {"index": index, "input": text, "text": "", "error": str(e)}
+            row: Dict[str, Any] = {
+                "index": index,
+                "input": text,
+                "text": self._prepare_text_output(response_payload),
+                "error": None,
+            }
+            if isinstance(response_payload, dict) and response_payload.get("timings"):
+                row["timings"] = response_payload["timings"]
+            return row
+
+        self._batch_running = True
+        try:
+            rows = await asyncio.gather(*(_run_item(i, item) for i, item in enumerate(items)))
+        finally:
+            self._batch_running = False
+        for stats in http_pool_stats():
+            self.log(f"[CoEModelPicker] http pool after batch: {stats}")
+        failed = sum(1 for row in rows if row["error"])
+        self.log(
+            f"[CoEModelPicker] batch done: {len(rows)} items, {failed} failed, "
+            f"{(time.perf_counter() - started):.2f}s (concurrency={concurrency})"
+        )
+        if Data is None:
+            return list(rows)
+        return [Data(data=row) for row in rows]
+
     def get_model_id(self) -> str:
+        # 이번 실행의 응답이 있으면 실제로 응답한 모델(자동 선택/레이스 승자 포함)을 반환
+        memo = getattr(self, "_response_memo", None)
+        if memo is not None:
+            served = (memo[1].get("routing") or {}).get("model_id")
+            if served:
+                return str(served)
         name = (getattr(self, "model_name", "") or "").strip()
-        return self._name_to_id.get(name, "")
\ No newline at end of file
+        base = self._normalize(
+            (getattr(self, "backend_url", "") or DEFAULT_BACKEND), bool(getattr(self, "force_https", False))
+        )
+        if name == AUTO_MODEL_OPTION:
+            return _MODEL_ROUTER.choose(self._auto_candidates(base))
+        return self._lookup_model_id(name, base)
\ No newline at end of file